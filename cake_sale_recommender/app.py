@@ -1,17 +1,26 @@
 # Flask Main App
-from flask import Flask, render_template, request, redirect, url_for, flash
-from cake_sales_analysis import CakeSalesTracker
+from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, Response
+from cake_sales_analysis import CAKE_TYPES, CakeSalesTracker
 from recommender import generate_recommendations
-from database import get_connection, get_all_cake_types, get_all_regions
+from dimension_cache import cake_type_names, region_names
 from datetime import datetime 
 from database import initialize_database
+import os
+import dashboard_cache
+import metrics
+import report_export
+import rolling_window
+from training_jobs import SUCCEEDED, TrainingJobQueue
 
 # Initialize database tables on first run
 initialize_database()
+rolling_window.rebuild()
 
 app = Flask(__name__)
 app.secret_key = 'your_secret_key'
 tracker = CakeSalesTracker()
+# Jobs train on their own tracker; `tracker` keeps serving the previous model version
+training_jobs = TrainingJobQueue(lambda: CakeSalesTracker(model_dir=tracker.model_dir), model_dir=tracker.model_dir)
 
 @app.route('/')
 def index():
@@ -19,8 +28,8 @@ def index():
 @app.route('/record_sales', methods=['GET', 'POST'])
 def record_sales():
     # Fetch cake types and regions from the database
-    cake_types = [ct[0] for ct in get_all_cake_types()]
-    regions = [r[0] for r in get_all_regions()]
+    cake_types = cake_type_names()
+    regions = region_names()
     
     if request.method == 'POST':
         date = request.form['date']
@@ -54,29 +63,29 @@ def record_sales():
 @app.route('/generate_predictions', methods=['GET', 'POST'])
 def generate_predictions():
     predictions = {}
-    cake_types = [ct[0] for ct in get_all_cake_types()]
-    regions = [r[0] for r in get_all_regions()]
+    cake_types = cake_type_names()
+    regions = region_names()
     
     if request.method == 'POST':
         date = request.form['date']
         region = request.form['region']
         try: 
-            predictions = tracker.predict_next_day(datetime.strptime(date, '-%Y-%m-%d'), region)
+            date = datetime.strptime(date, '%Y-%m-%d')
         except ValueError:
             flash("Invalid date format. Please use YYYY-MM-DD.")
             return redirect(url_for('generate_predictions'))
-        predictions = tracker.predict_next_day(date, region)
+        predictions = tracker.predict_fast(date, region)
         if predictions:
-            tracker.add_prediction_to_excel(datetime.strptime(date, '-%Y-%m-%d'), region, predictions)
+            tracker.add_prediction(date, region, predictions)
             flash("Prediction generated successfully!")
         else:
-            flash("Failed to generate prediction. Please train the model first.")
+            flash("Failed to generate prediction. Please train the model first, or retrain it if the region is new.")
     return render_template('generate_predictions.html', cake_types=cake_types, regions=regions, predictions=predictions)
 
 @app.route('/recommendations', methods=['GET', 'POST'])
 def recommendations():
-    cake_types = [ct[0] for ct in get_all_cake_types()]
-    regions = [r[0] for r in get_all_regions()]
+    cake_types = cake_type_names()
+    regions = region_names()
     recommendations = {}
 
     if request.method == 'POST':
@@ -90,26 +99,97 @@ def recommendations():
 
 @app.route('/analysis')
 def analysis():
-    try: 
-        tracker.update_summaries()
-        tracker.update_dashboard()
-    except Exception as e:
-        flash(f"Error updating analysis: {e}")
-        return redirect(url_for('analysis'))
-    return render_template('analysis.html')
+    # Served from the cache; stale copies are rebuilt in the background
+    dashboard = dashboard_cache.get_dashboard()
+    return render_template('analysis.html', dashboard=dashboard)
 
 @app.route('/train-model')
 def train_model():
     try:
-        tracker.train_prediction_model()
-        flash("Model trained successfully!", "info")
+        job, created = training_jobs.submit(
+            mode=request.args.get('mode', 'per_cake'), incremental=request.args.get('incremental') == '1'
+        )
+        if created:
+            flash(f"Model training started (job {job['id']}).", "info")
+        else:
+            flash(f"Model training is already in progress (job {job['id']}).", "info")
     except Exception as e:
         flash(f"Error training model: {e}")
-    return redirect(url_for('base'))
+    return redirect(url_for('analysis'))
+
+@app.route('/api/training-jobs', methods=['GET', 'POST'])
+def training_job_list():
+    if request.method == 'GET':
+        return jsonify(training_jobs.jobs())
+    try:
+        job, created = training_jobs.submit(
+            mode=request.args.get('mode', 'per_cake'), incremental=request.args.get('incremental') == '1'
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(job), 202 if created else 200
+
+@app.route('/api/training-jobs/<job_id>')
+def training_job_status(job_id):
+    job = training_jobs.status(job_id)
+    if job is None:
+        return jsonify({'error': f"Unknown training job '{job_id}'."}), 404
+    return jsonify(job)
+
+@app.route('/api/training-jobs/<job_id>/metrics')
+def training_job_metrics(job_id):
+    job = training_jobs.status(job_id)
+    if job is None:
+        return jsonify({'error': f"Unknown training job '{job_id}'."}), 404
+    if job['status'] != SUCCEEDED:
+        return jsonify({'error': f"Training job is {job['status']}.", 'status': job['status']}), 409
+    return jsonify({'model_version': job['model_version'], 'metrics': job['metrics']})
+
+def _metric_filters():
+    return {
+        'start': request.args.get('start') or None,
+        'end': request.args.get('end') or None,
+        'region': request.args.get('region') or None,
+    }
+
+def _metric_response(compute):
+    filters = _metric_filters()
+    try:
+        result = compute(**filters)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({'filters': filters, **result})
+
+@app.route('/api/metrics')
+def api_metrics():
+    return _metric_response(lambda **filters: metrics.key_metrics(**filters))
+
+@app.route('/api/metrics/cakes')
+def api_metrics_cakes():
+    return _metric_response(lambda **filters: {
+        'sales': [{'cake_type': name, 'sales': qty} for name, qty in metrics.sales_by_cake(**filters)]
+    })
+
+@app.route('/api/metrics/days')
+def api_metrics_days():
+    return _metric_response(lambda **filters: {
+        'sales': [{'day_of_week': name, 'sales': qty} for name, qty in metrics.sales_by_day_of_week(**filters)]
+    })
+
+@app.route('/api/metrics/regions')
+def api_metrics_regions():
+    return _metric_response(lambda **filters: {
+        'sales': [{'region': name, 'sales': qty} for name, qty in metrics.sales_by_region(**filters)]
+    })
 
 @app.route('/download-report')
 def download_report():
-    return send_file(tracker.excel_file, as_attachment=True)
+    # Streamed from a write-only workbook instead of rebuilding the report on disk
+    return Response(
+        report_export.stream_report(CAKE_TYPES),
+        mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+        headers={'Content-Disposition': f'attachment; filename={os.path.basename(tracker.excel_file)}'},
+    )
 
 
 if __name__ == '__main__':
@@ -0,0 +1,523 @@
+"""
+Benchmarks for the cake sales storage, recommendation and prediction code
+
+Run a single benchmark with `python benchmarks.py <name>`, or all of them
+with no arguments. Each benchmark works on its own temporary database.
+"""
+import os
+import sqlite3
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from datetime import date, datetime, timedelta
+
+import database
+import recommendation_cache
+import rolling_window
+from recommender import generate_all_recommendations, generate_recommendations, get_recent_sales
+
+# bench_concurrency fails unless the WAL read p99 is at most this fraction of
+# the rollback-journal (DELETE) p99
+WAL_MAX_P99_RATIO = 0.5
+
+
+class BenchmarkCheckFailed(Exception):
+    """A benchmark's result check failed; benchmarks.py exits non-zero"""
+
+
+def _temp_database(regions=4, cakes=4):
+    """Point the shared pool at a fresh database with generated regions and cakes"""
+    path = os.path.join(tempfile.mkdtemp(prefix='cake_bench_'), 'cake_sales.db')
+    database.configure_pool(database=path)
+    database.initialize_database()
+    region_names = [f"Region {i}" for i in range(regions)]
+    cake_names = [f"Cake {i}" for i in range(cakes)]
+    for name in region_names:
+        database.add_region(name)
+    for name in cake_names:
+        database.add_cake_type(name)
+    recommendation_cache.clear()
+    rolling_window.rebuild()
+    return path, region_names, cake_names
+
+
+def _history(region_names, cake_names, days, end=None):
+    """Generate (date, region, cake, quantity) rows for every day in the range"""
+    end = end or date.today()
+    for offset in range(days):
+        day = end - timedelta(days=offset)
+        for r, region in enumerate(region_names):
+            for c, cake in enumerate(cake_names):
+                yield day, region, cake, 10 + (offset + r * 3 + c * 7) % 40
+
+
+def _percentile(values, pct):
+    if not values:
+        return float('nan')
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def bench_concurrency(writers=4, readers=4, duration=3.0):
+    """
+    Reader latency while several threads write sales, rollback journal vs. WAL
+
+    Raises BenchmarkCheckFailed unless reads under WAL stall clearly less than
+    under the rollback journal (see WAL_MAX_P99_RATIO).
+    """
+    p99 = {}
+    original_mode = database.CONNECTION_PRAGMAS['journal_mode']
+    print(f"{writers} writers, {readers} readers, {duration:.0f}s per journal mode")
+    # Readers must query SQLite, not the in-memory windows
+    rolling_window.set_enabled(False)
+    try:
+        for journal_mode in ('DELETE', 'WAL'):
+            database.CONNECTION_PRAGMAS['journal_mode'] = journal_mode
+            _, region_names, cake_names = _temp_database()
+            database.add_sales_bulk(_history(region_names, cake_names, days=365))
+
+            stop = threading.Event()
+            lock = threading.Lock()
+            latencies = []
+            counts = {'writes': 0, 'reads': 0, 'errors': 0}
+
+            def writer(i):
+                region = region_names[i % len(region_names)]
+                while not stop.is_set():
+                    try:
+                        database.add_sale(date.today(), region, cake_names[0], 1)
+                        key = 'writes'
+                    except sqlite3.OperationalError:
+                        key = 'errors'
+                    with lock:
+                        counts[key] += 1
+
+            def reader():
+                while not stop.is_set():
+                    start = time.perf_counter()
+                    try:
+                        get_recent_sales(days=30)
+                        key = 'reads'
+                    except sqlite3.OperationalError:
+                        key = 'errors'
+                    elapsed = time.perf_counter() - start
+                    with lock:
+                        counts[key] += 1
+                        latencies.append(elapsed)
+
+            threads = [threading.Thread(target=writer, args=(i,)) for i in range(writers)]
+            threads += [threading.Thread(target=reader) for _ in range(readers)]
+            for thread in threads:
+                thread.start()
+            time.sleep(duration)
+            stop.set()
+            for thread in threads:
+                thread.join()
+
+            p99[journal_mode] = _percentile(latencies, 99)
+            print(f"  {journal_mode:6s} writes={counts['writes']:6d} reads={counts['reads']:6d} "
+                  f"errors={counts['errors']:4d} read p50={_percentile(latencies, 50) * 1000:7.2f}ms "
+                  f"p99={_percentile(latencies, 99) * 1000:7.2f}ms "
+                  f"max={max(latencies, default=0) * 1000:7.2f}ms")
+    finally:
+        database.CONNECTION_PRAGMAS['journal_mode'] = original_mode
+        rolling_window.set_enabled(True)
+
+    if not p99['WAL'] <= p99['DELETE'] * WAL_MAX_P99_RATIO:
+        raise BenchmarkCheckFailed(
+            f"WAL read p99 {p99['WAL'] * 1000:.2f}ms is not below {WAL_MAX_P99_RATIO:.0%} "
+            f"of the DELETE read p99 {p99['DELETE'] * 1000:.2f}ms"
+        )
+    print(f"  OK: WAL read p99 is {p99['WAL'] / p99['DELETE']:.0%} of the DELETE read p99")
+
+
+def bench_all_regions(region_counts=(10, 100, 1000), cakes=8, days=45, repeat=3):
+    """
+    Per-region generate_recommendations loop vs. generate_all_recommendations
+
+    Both run against the daily rollup; the rolling-window aggregator is
+    switched off so the SQL paths are compared.
+    """
+    rolling_window.set_enabled(False)
+    try:
+        _bench_all_regions(region_counts, cakes, days, repeat)
+    finally:
+        rolling_window.set_enabled(True)
+
+
+def _bench_all_regions(region_counts, cakes, days, repeat):
+    for count in region_counts:
+        _, region_names, cake_names = _temp_database(regions=count, cakes=cakes)
+        database.add_sales_bulk(_history(region_names, cake_names, days=days))
+
+        loop_times, single_times = [], []
+        for _ in range(repeat):
+            recommendation_cache.clear()
+            start = time.perf_counter()
+            looped = {region: generate_recommendations(region=region) for region in region_names}
+            looped[None] = generate_recommendations()
+            loop_times.append(time.perf_counter() - start)
+
+            recommendation_cache.clear()
+            start = time.perf_counter()
+            single = generate_all_recommendations()
+            single_times.append(time.perf_counter() - start)
+
+        assert {r: dict(recs) for r, recs in looped.items()} == {r: dict(recs) for r, recs in single.items()}
+        loop, single_pass = min(loop_times), min(single_times)
+        print(f"  {count:5d} regions: per-region loop {loop * 1000:9.1f}ms  "
+              f"single pass {single_pass * 1000:8.1f}ms  ({loop / single_pass:.1f}x)")
+
+
+def bench_rolling_window(regions=20, cakes=8, history_days=730, repeat=20):
+    """30-day totals from the rollup query vs. the incremental rolling window"""
+    _, region_names, cake_names = _temp_database(regions=regions, cakes=cakes)
+    database.add_sales_bulk(_history(region_names, cake_names, days=history_days))
+    for days in (7, 30, 90):
+        rolling_window.set_enabled(False)
+        start = time.perf_counter()
+        for _ in range(repeat):
+            expected = get_recent_sales(days=days)
+        query = (time.perf_counter() - start) / repeat
+        rolling_window.set_enabled(True)
+
+        start = time.perf_counter()
+        for _ in range(repeat):
+            totals = get_recent_sales(days=days)
+        incremental = (time.perf_counter() - start) / repeat
+        assert totals == expected
+        print(f"  {days:3d}-day window over {history_days} days of history: rollup query "
+              f"{query * 1000:7.2f}ms  rolling window {incremental * 1000:6.2f}ms")
+
+
+def bench_iso_weeks(years=3, regions=50, repeat=5):
+    """Row-wise fromisocalendar apply vs. column-wise ISO week start dates"""
+    import pandas as pd
+    from summaries import iso_week_start
+
+    days = pd.date_range('2021-01-01', periods=365 * years, freq='D')
+    daily = pd.DataFrame({
+        'Date': days.repeat(regions),
+        'Region': [f"Region {i}" for i in range(regions)] * len(days),
+        'Total Sales': 1,
+    })
+    iso = daily['Date'].dt.isocalendar()
+    weekly = daily.groupby(['Region', iso.year.rename('Year'), iso.week.rename('Week')])['Total Sales'].sum().reset_index()
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        expected = weekly.apply(lambda row: datetime.fromisocalendar(int(row['Year']), int(row['Week']), 1), axis=1)
+    row_wise = (time.perf_counter() - start) / repeat
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        starts = iso_week_start(weekly['Year'], weekly['Week'])
+    vectorized = (time.perf_counter() - start) / repeat
+
+    assert (pd.to_datetime(expected) == starts).all()
+    print(f"  {len(weekly)} weekly rows ({years} years x {regions} regions): apply {row_wise * 1000:8.2f}ms  "
+          f"vectorized {vectorized * 1000:6.2f}ms  ({row_wise / vectorized:.0f}x)")
+
+
+def _seasonal_history(region_names, cake_names, days, end=None):
+    """Sales with weekday, month and region effects so the models have something to learn"""
+    import random
+    rng = random.Random(42)
+    end = end or date.today()
+    for offset in range(days):
+        day = end - timedelta(days=offset)
+        weekend = 1.5 if day.weekday() >= 5 else 1.0
+        for r, region in enumerate(region_names):
+            for c, cake in enumerate(cake_names):
+                base = 10 + 3 * ((r + c) % 5) + 2 * (day.month % 3)
+                yield day, region, cake, int(base * weekend + rng.randint(0, 6))
+
+
+def bench_model_modes(regions=4, days=730, predictions=200):
+    """Per-cake forests vs. one multi-output forest: training time, inference latency and MAE"""
+    from cake_sales_analysis import CAKE_TYPES, CakeSalesTracker
+
+    _, region_names, _ = _temp_database(regions=regions, cakes=0)
+    for cake in CAKE_TYPES:
+        database.add_cake_type(cake)
+    database.add_sales_bulk(_seasonal_history(region_names, CAKE_TYPES, days=days))
+
+    tracker = CakeSalesTracker(model_dir=tempfile.mkdtemp(prefix='cake_models_'))
+    for mode in ('per_cake', 'multi_output'):
+        start = time.perf_counter()
+        tracker.train_prediction_model(mode=mode)
+        training = time.perf_counter() - start
+
+        latencies = []
+        for i in range(predictions):
+            start = time.perf_counter()
+            tracker.predict_next_day(date.today() + timedelta(days=i % 30), region_names[i % len(region_names)])
+            latencies.append(time.perf_counter() - start)
+
+        mae = statistics.mean(report['mae'] for report in tracker.training_report.values())
+        print(f"  {mode:12s} train {training:6.2f}s  predict p50 {_percentile(latencies, 50) * 1000:6.2f}ms  "
+              f"p99 {_percentile(latencies, 99) * 1000:6.2f}ms  mean MAE {mae:.2f}")
+
+
+def bench_predict_range(regions=20, days=365, horizon=14, repeat=3):
+    """predict_next_day per (date, region) vs. one predict_range batch"""
+    from cake_sales_analysis import CAKE_TYPES, CakeSalesTracker
+
+    _, region_names, _ = _temp_database(regions=regions, cakes=0)
+    for cake in CAKE_TYPES:
+        database.add_cake_type(cake)
+    database.add_sales_bulk(_seasonal_history(region_names, CAKE_TYPES, days=days))
+
+    tracker = CakeSalesTracker(model_dir=tempfile.mkdtemp(prefix='cake_models_'))
+    start_day = date.today() + timedelta(days=1)
+    days_ahead = [start_day + timedelta(days=i) for i in range(horizon)]
+    for mode in ('per_cake', 'multi_output'):
+        tracker.train_prediction_model(mode=mode)
+
+        loop_times, batch_times = [], []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            looped = {
+                (day, region): tracker.predict_next_day(datetime.combine(day, datetime.min.time()), region)
+                for day in days_ahead for region in region_names
+            }
+            loop_times.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            batch = tracker.predict_range(days_ahead[0], days_ahead[-1], region_names)
+            batch_times.append(time.perf_counter() - start)
+
+        batched = {
+            (day.date(), region, cake): quantity
+            for day, region, cake, quantity in batch.itertuples(index=False)
+        }
+        assert all(
+            batched[(day, region, cake)] == quantity
+            for (day, region), predictions in looped.items() for cake, quantity in predictions.items()
+        ), "predict_range disagrees with predict_next_day"
+        loop, batch_time = min(loop_times), min(batch_times)
+        print(f"  {mode:12s} {horizon} days x {regions} regions: loop {loop * 1000:8.1f}ms  "
+              f"batch {batch_time * 1000:6.1f}ms  ({loop / batch_time:.0f}x)")
+
+
+def bench_inference_latency(regions=4, days=730, predictions=500):
+    """Single-row latency: predict_next_day vs. the NumPy fast path, with and without memoization"""
+    from cake_sales_analysis import CAKE_TYPES, CakeSalesTracker
+
+    _, region_names, _ = _temp_database(regions=regions, cakes=0)
+    for cake in CAKE_TYPES:
+        database.add_cake_type(cake)
+    database.add_sales_bulk(_seasonal_history(region_names, CAKE_TYPES, days=days))
+
+    tracker = CakeSalesTracker(model_dir=tempfile.mkdtemp(prefix='cake_models_'))
+    requests = [
+        (datetime.combine(date.today() + timedelta(days=i % 14), datetime.min.time()), region_names[i % len(region_names)])
+        for i in range(predictions)
+    ]
+    for mode in ('per_cake', 'multi_output'):
+        tracker.train_prediction_model(mode=mode)
+        paths = {
+            'predict_next_day': tracker.predict_next_day,
+            'fast': lambda day, region: tracker.predict_fast(day, region, memoize=False),
+            'fast, memoized': tracker.predict_fast,
+        }
+        results = {}
+        for label, predict in paths.items():
+            latencies = []
+            results[label] = []
+            for day, region in requests:
+                start = time.perf_counter()
+                results[label].append(predict(day, region))
+                latencies.append(time.perf_counter() - start)
+            print(f"  {mode:12s} {label:16s} p50 {_percentile(latencies, 50) * 1000:7.3f}ms  "
+                  f"p99 {_percentile(latencies, 99) * 1000:7.3f}ms")
+        assert results['fast'] == results['predict_next_day'] == results['fast, memoized'], \
+            "fast path disagrees with predict_next_day"
+
+
+def bench_report_export(regions=20, cakes=8, days=365):
+    """Full report: pandas export + openpyxl load/save vs. the streaming write-only export (time, peak memory)"""
+    import report_export
+    from cake_sales_analysis import CakeSalesTracker
+    from storage import export_to_excel
+
+    _, region_names, cake_names = _temp_database(regions=regions, cakes=cakes)
+    database.add_sales_bulk(_history(region_names, cake_names, days=days))
+    directory = tempfile.mkdtemp(prefix='cake_report_')
+    tracker = CakeSalesTracker(excel_file=os.path.join(directory, 'report.xlsx'))
+    tracker.update_summaries()
+
+    def in_memory():
+        export_to_excel(tracker.storage, tracker.excel_file, cake_names)
+        tracker.update_summaries()
+        tracker.update_dashboard()
+
+    def streaming():
+        for _ in report_export.stream_report(cake_names):
+            pass
+
+    for label, export in (('pandas/openpyxl', in_memory), ('write-only stream', streaming)):
+        tracemalloc.start()
+        start = time.perf_counter()
+        export()
+        seconds = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        print(f"  {label:18s} {regions * days} rows: {seconds:6.2f}s  peak {peak / 2**20:7.1f} MiB")
+
+
+def bench_dashboard(regions=50, cakes=8, days=365, requests=200):
+    """Dashboard latency while sales are being written: rebuild per request vs. the version-keyed cache"""
+    import dashboard_cache
+
+    _, region_names, cake_names = _temp_database(regions=regions, cakes=cakes)
+    database.add_sales_bulk(_history(region_names, cake_names, days=days))
+    dashboard_cache.clear()
+    dashboard_cache.build_dashboard()
+
+    stop = threading.Event()
+
+    def writer():
+        day = date.today() + timedelta(days=1)
+        while not stop.is_set():
+            database.add_sales_bulk([(day, region, cake_names[0], 1) for region in region_names[:5]])
+            time.sleep(0.05)
+
+    thread = threading.Thread(target=writer)
+    thread.start()
+    try:
+        for label, load in (('rebuild', dashboard_cache.build_dashboard), ('cached', dashboard_cache.get_dashboard)):
+            latencies = []
+            for _ in range(requests):
+                start = time.perf_counter()
+                load()
+                latencies.append(time.perf_counter() - start)
+            print(f"  {label:8s} p50 {_percentile(latencies, 50) * 1000:7.2f}ms  p99 {_percentile(latencies, 99) * 1000:7.2f}ms")
+    finally:
+        stop.set()
+        thread.join()
+    print(f"  cache: {dashboard_cache.get_cache_stats()}")
+
+
+def bench_snapshot(regions=50, cakes=8, days=1095, repeat=3):
+    """Loading the sales history from SQLite vs. the Parquet snapshot plus delta"""
+    import snapshot_store
+    from storage import SQLiteSalesStorage
+
+    if not snapshot_store.available():
+        print("  pyarrow is not installed; skipping")
+        return
+    _, region_names, cake_names = _temp_database(regions=regions, cakes=cakes)
+    database.add_sales_bulk(_history(region_names, cake_names, days=days))
+    snapshot_dir = tempfile.mkdtemp(prefix='cake_snapshots_')
+    start = time.perf_counter()
+    snapshot_store.write_snapshot(snapshot_dir)
+    print(f"  write snapshot: {time.perf_counter() - start:.2f}s")
+    # Sales recorded after the snapshot come from the SQLite delta
+    database.add_sales_bulk(_history(region_names, cake_names, days=3, end=date.today() + timedelta(days=3)))
+
+    quarter_start = date.today() - timedelta(days=90)
+    loads = {
+        'SQLite, full history': lambda: SQLiteSalesStorage().load_sales(cake_names),
+        'snapshot, full history': lambda: snapshot_store.SnapshotSalesStorage(snapshot_dir).load_sales(cake_names),
+        'SQLite, 1 region x 90 days': lambda: [
+            row for row in database.get_sales_by_region(region_names[0]) if row[0] >= quarter_start.isoformat()
+        ],
+        'snapshot, 1 region x 90 days': lambda: snapshot_store.load_daily_sales(
+            ('day', 'qty'), start=quarter_start, regions=region_names[:1], snapshot_dir=snapshot_dir),
+    }
+    for label, load in loads.items():
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            load()
+            timings.append(time.perf_counter() - start)
+        print(f"  {label:30s} {min(timings) * 1000:8.1f}ms")
+
+
+def bench_compact_frame(regions=200, cakes=8, days=365):
+    """Memory of the loaded sales frame as read from storage vs. compacted, and after training"""
+    from cake_sales_analysis import CakeSalesTracker, compact_sales_frame
+    from storage import SQLiteSalesStorage
+
+    _, region_names, cake_names = _temp_database(regions=regions, cakes=cakes)
+    database.add_sales_bulk(_history(region_names, cake_names, days=days))
+
+    raw = SQLiteSalesStorage().load_sales(cake_names)
+    raw_bytes = raw.memory_usage(deep=True).sum()
+    compact_bytes = compact_sales_frame(raw).memory_usage(deep=True).sum()
+    print(f"  {len(raw)} rows: raw {raw_bytes / 2**20:.2f} MiB, compact {compact_bytes / 2**20:.2f} MiB "
+          f"({raw_bytes / compact_bytes:.1f}x smaller)")
+
+    tracker = CakeSalesTracker(storage=SQLiteSalesStorage(), model_dir=tempfile.mkdtemp(prefix='cake_models_'))
+    tracker.load_data()
+    before = tracker.sales_data.memory_usage(deep=True).sum()
+    tracker.train_prediction_model(publish=False)
+    after = tracker.sales_data.memory_usage(deep=True).sum()
+    print(f"  sales_data before training {before / 2**20:.2f} MiB, after {after / 2**20:.2f} MiB")
+
+
+def bench_region_encoding(regions=300, days=30, encodings=None):
+    """Region encodings with many regions: feature matrix size, training time, MAE and range prediction"""
+    from cake_sales_analysis import CAKE_TYPES, CakeSalesTracker
+    from feature_encoding import ENCODINGS
+    from storage import SQLiteSalesStorage
+
+    _, region_names, _ = _temp_database(regions=regions, cakes=0)
+    for cake in CAKE_TYPES:
+        database.add_cake_type(cake)
+    database.add_sales_bulk(_seasonal_history(region_names, CAKE_TYPES, days=days))
+
+    tracker = CakeSalesTracker(storage=SQLiteSalesStorage(), model_dir=tempfile.mkdtemp(prefix='cake_models_'))
+    for encoding in encodings or ENCODINGS:
+        start = time.perf_counter()
+        tracker.train_prediction_model(mode='multi_output', encoding=encoding)
+        training = time.perf_counter() - start
+
+        X = tracker.feature_encoder.transform(tracker.sales_data['Date'], tracker.sales_data['Region'].astype(str))
+        if hasattr(X, 'memory_usage'):
+            size = X.memory_usage(deep=True).sum()
+        else:
+            size = X.data.nbytes + X.indices.nbytes + X.indptr.nbytes
+
+        start = time.perf_counter()
+        tracker.predict_range(date.today() + timedelta(days=1), date.today() + timedelta(days=7))
+        predicting = time.perf_counter() - start
+
+        mae = statistics.mean(report['mae'] for report in tracker.training_report.values())
+        print(f"  {encoding:8s} {X.shape[0]} x {X.shape[1]:5d} features {size / 2**20:7.2f} MiB  "
+              f"train {training:6.2f}s  predict 7 days {predicting:6.2f}s  mean MAE {mae:.2f}")
+
+
+BENCHMARKS = {
+    'concurrency': bench_concurrency,
+    'all_regions': bench_all_regions,
+    'rolling_window': bench_rolling_window,
+    'iso_weeks': bench_iso_weeks,
+    'model_modes': bench_model_modes,
+    'predict_range': bench_predict_range,
+    'inference_latency': bench_inference_latency,
+    'report_export': bench_report_export,
+    'dashboard': bench_dashboard,
+    'snapshot': bench_snapshot,
+    'compact_frame': bench_compact_frame,
+    'region_encoding': bench_region_encoding,
+}
+
+
+if __name__ == "__main__":
+    names = sys.argv[1:] or list(BENCHMARKS)
+    failed = []
+    for name in names:
+        print(f"== {name} ==")
+        try:
+            BENCHMARKS[name]()
+        except BenchmarkCheckFailed as e:
+            print(f"  FAILED: {e}")
+            failed.append(name)
+    if failed:
+        print(f"Failed checks: {', '.join(failed)}")
+        sys.exit(1)
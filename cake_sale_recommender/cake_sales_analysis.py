@@ -10,31 +10,197 @@ from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
 from openpyxl.chart import BarChart, Reference, LineChart
 from datetime import datetime, timedelta
 import calendar
+import copy
 import os
+import threading
+import time
 
-from database import get_connection
+from joblib import Parallel, delayed
+
+from storage import SQLiteSalesStorage, export_to_excel
+from snapshot_store import SnapshotSalesStorage
+from report_export import write_report
+from summaries import iso_week_start, load_summaries, update_summary_tables
+import model_registry
+from fast_inference import FastPredictor, flatten_forests
+from feature_encoding import REGION_ENCODING, FeatureEncoder
 
 
 CAKE_TYPES = ["Chocolate", "Vanilla", "Strawberry", "Red Velvet"]
 REGIONS = ["North", "South", "East", "West"]
 DAYS_OF_WEEK = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+REPORT_FILE = 'cake_sales_report.xlsx'
+
+# Cores train_prediction_model may use across all cake models
+TRAINING_WORKERS = int(os.environ.get('CAKE_SALES_TRAINING_WORKERS', os.cpu_count() or 1))
+
+# 'per_cake' fits one forest per cake type, 'multi_output' one forest for all of them
+MODEL_MODES = ('per_cake', 'multi_output')
+MULTI_OUTPUT_MODEL = 'All Cakes'
+
+# Memory-map the saved tree arrays predict_fast serves from, so worker
+# processes loading the same model version share one copy of its pages
+MODEL_MMAP = os.environ.get('CAKE_SALES_MODEL_MMAP', '1') == '1'
+
+# Incremental retraining adds this many trees per model, fitted on the new sales only
+INCREMENTAL_TREES = int(os.environ.get('CAKE_SALES_INCREMENTAL_TREES', 20))
+# ... and falls back to a full retrain after this many incremental rounds
+FULL_RETRAIN_EVERY = int(os.environ.get('CAKE_SALES_FULL_RETRAIN_EVERY', 7))
+# Fewer new (date, region) rows than this are not worth a round
+MIN_INCREMENTAL_ROWS = 10
+
+
+def _fit_cake_model(name, X_train, X_test, y_train, y_test, n_jobs, base_model=None):
+    """
+    Fit and evaluate one forest; returns (name, model, mse, mae, seconds)
+    
+    y may be a single cake column or a frame of several, in which case
+    mse and mae are arrays with one value per column. With base_model, a
+    copy of it gets INCREMENTAL_TREES more trees fitted on this data.
+    """
+    start = time.perf_counter()
+    if base_model is None:
+        model = RandomForestRegressor(n_estimators=100, random_state=42, n_jobs=n_jobs)
+    else:
+        model = copy.deepcopy(base_model)
+        model.set_params(warm_start=True, n_estimators=len(model.estimators_) + INCREMENTAL_TREES, n_jobs=n_jobs)
+    model.fit(X_train, y_train)
+    seconds = time.perf_counter() - start
+    
+    # Evaluate model
+    y_pred = model.predict(X_test)
+    mse = mean_squared_error(y_test, y_pred, multioutput='raw_values')
+    mae = mean_absolute_error(y_test, y_pred, multioutput='raw_values')
+    return name, model, mse, mae, seconds
+
+
+def _take_rows(X, rows):
+    """Rows of a feature frame or sparse feature matrix by position"""
+    return X.iloc[rows] if isinstance(X, pd.DataFrame) else X[rows]
+
+
+def _smallest_int(series):
+    """series as int16 or int32 if its values fit, otherwise unchanged"""
+    for dtype in ('int16', 'int32'):
+        info = np.iinfo(dtype)
+        if series.empty or (series.min() >= info.min and series.max() <= info.max):
+            return series.astype(dtype)
+    return series
+
+
+def compact_sales_frame(sales):
+    """
+    Copy of a load_sales frame with compact dtypes
+    
+    Region and Day of Week become categoricals (days in calendar order) and
+    the quantity columns are downcast to int16/int32 where the values fit.
+    """
+    compact = sales.copy()
+    compact['Region'] = compact['Region'].astype('category')
+    compact['Day of Week'] = pd.Categorical(compact['Day of Week'], categories=DAYS_OF_WEEK, ordered=True)
+    for column in compact.columns:
+        if pd.api.types.is_integer_dtype(compact[column]):
+            compact[column] = _smallest_int(compact[column])
+    return compact
+
 
 class CakeSalesTracker:
-    def __init__(self):
-        pass # removed the excel_file
+    def __init__(self, storage=None, excel_file=REPORT_FILE, model_dir=model_registry.MODEL_DIR):
+        """
+        Parameters:
+        - storage: SalesStorage backend (defaults to the SQLite database, read
+          through the Parquet snapshot when one has been written)
+        - excel_file: Path the Excel report is exported to
+        - model_dir: Model registry directory trained models are shared through
+        """
+        self.storage = storage or SnapshotSalesStorage()
+        self.excel_file = excel_file
+        self.model_dir = model_dir
+        self._models = {}
+        self.model_version = None
+        # Guards swapping in a loaded version against the lazy models getter
+        self._model_lock = threading.Lock()
+        self.model_metadata = {}
+        self.feature_encoder = None
+        self._fast_predictor = None
+    
+    @property
+    def models(self):
+        """
+        Fitted forests by model name
+        
+        A loaded version's forests are only read from the registry when first
+        needed (predict_next_day, predict_range, incremental training), so
+        workers serving predict_fast never unpickle them. The forests are
+        only cached if the version they were read for is still the loaded one.
+        """
+        with self._model_lock:
+            models, version = self._models, self.model_version
+        if models is None:
+            bundle, _ = model_registry.load_version(version, self.model_dir)
+            models = bundle['models']
+            with self._model_lock:
+                if self._models is None and self.model_version == version:
+                    self._models = models
+        return models
     
-    def load_data(self):
-        """Load data from Excel file into pandas DataFrame"""
+    @models.setter
+    def models(self, models):
+        self._models = models
+    
+    def load_data(self, since_id=None):
+        """
+        Load sales from storage into a compact pandas DataFrame (see
+        compact_sales_frame); with since_id only rows with newer sales
+        
+        self.sales_data is shared by training and the dashboard and is never
+        modified in place; derived columns are built on the side.
+        """
         try:
-            self.sales_data = pd.read_excel(self.excel_file, sheet_name='Daily Sales')
-            return True
+            self.sales_data = compact_sales_frame(self.storage.load_sales(CAKE_TYPES, since_id=since_id))
         except Exception as e:
             print(f"Error loading data: {e}")
             return False
+        return not self.sales_data.empty
+    
+    def memory_report(self):
+        """
+        Print and return the memory held by self.sales_data
+        
+        Returns:
+        - Dictionary with 'rows', 'total_bytes' and 'columns' ({column: bytes})
+        """
+        if getattr(self, 'sales_data', None) is None:
+            return {'rows': 0, 'total_bytes': 0, 'columns': {}}
+        usage = self.sales_data.memory_usage(index=True, deep=True)
+        report = {
+            'rows': len(self.sales_data),
+            'total_bytes': int(usage.sum()),
+            'columns': {column: int(size) for column, size in usage.items()},
+        }
+        print(f"sales_data: {report['rows']} rows, {report['total_bytes'] / 2**20:.2f} MiB")
+        for column, size in report['columns'].items():
+            dtype = self.sales_data[column].dtype if column in self.sales_data else 'index'
+            print(f"  {column}: {size / 2**10:.1f} KiB ({dtype})")
+        return report
+    
+    def export_report(self):
+        """
+        Write a fresh Excel report of sales and predictions; returns its path
+        
+        With the SQLite storage the full report, summaries and dashboard
+        included, is streamed from SQL (see report_export).
+        """
+        if isinstance(self.storage, SQLiteSalesStorage):
+            write_report(self.excel_file, CAKE_TYPES)
+            return self.excel_file
+        return export_to_excel(self.storage, self.excel_file, CAKE_TYPES)
     
     def add_daily_sales(self, date, region, sales_dict):
         """
-        Add daily sales data to the Excel file
+        Add daily sales data to the database
+        
+        All cake types for the day are written in a single transaction.
         
         Parameters:
         - date: Date of sales (string in format 'YYYY-MM-DD' or datetime object)
@@ -44,84 +210,39 @@ class CakeSalesTracker:
         if isinstance(date, str):
             date = datetime.strptime(date, '%Y-%m-%d')
         
-        day_of_week = DAYS_OF_WEEK[date.weekday()]
-        
-        # Load the workbook
-        workbook = openpyxl.load_workbook(self.excel_file)
-        daily_sheet = workbook['Daily Sales']
-        
-        # Find the next empty row
-        next_row = daily_sheet.max_row + 1
-        
-        # Add the date, day of week, and region
-        daily_sheet.cell(row=next_row, column=1).value = date
-        daily_sheet.cell(row=next_row, column=2).value = day_of_week
-        daily_sheet.cell(row=next_row, column=3).value = region
-        
-        # Add sales for each cake type
-        total_sales = 0
-        for col, cake_type in enumerate(CAKE_TYPES, 4):
-            sales = sales_dict.get(cake_type, 0)
-            daily_sheet.cell(row=next_row, column=col).value = sales
-            total_sales += sales
-        
-        # Add total sales
-        daily_sheet.cell(row=next_row, column=len(CAKE_TYPES) + 4).value = total_sales
-        
-        # Save the workbook
-        workbook.save(self.excel_file)
+        self.storage.add_daily_sales(date, region, sales_dict)
         print(f"Added sales data for {date.strftime('%Y-%m-%d')}")
     
-    def update_summaries(self):
-        """Update weekly, monthly, and analysis sheets based on daily sales data"""
-        if not self.load_data():
-            print("No data to summarize")
-            return
-        
-        # Convert date column to datetime if it's not already
-        if not pd.api.types.is_datetime64_any_dtype(self.sales_data['Date']):
-            self.sales_data['Date'] = pd.to_datetime(self.sales_data['Date'])
+    def update_summaries(self, full=False):
+        """
+        Update weekly, monthly, and analysis sheets from the persisted summaries
         
-        # Create weekly summary
-        self.sales_data['Week'] = self.sales_data['Date'].dt.isocalendar().week
-        self.sales_data['Year'] = self.sales_data['Date'].dt.isocalendar().year
+        Only sales recorded since the last update are folded into the summary
+        tables; pass full=True to rebuild them from all sales.
+        """
+        update_summary_tables(full=full)
+        summaries = load_summaries(CAKE_TYPES)
         
-        weekly_summary = self.sales_data.groupby(['Year', 'Week']).agg({
-            **{cake: 'sum' for cake in CAKE_TYPES},
-            'Total Sales': 'sum'
-        }).reset_index()
+        weekly_summary = summaries['weekly']
+        if weekly_summary.empty:
+            print("No data to summarize")
+            return
         
         # Add start and end date for each week
-        weekly_summary['Start Date'] = weekly_summary.apply(
-            lambda row: datetime.fromisocalendar(int(row['Year']), int(row['Week']), 1), axis=1
-        )
-        weekly_summary['End Date'] = weekly_summary.apply(
-            lambda row: datetime.fromisocalendar(int(row['Year']), int(row['Week']), 7), axis=1
-        )
+        weekly_summary['Start Date'] = iso_week_start(weekly_summary['Year'], weekly_summary['Week'])
+        weekly_summary['End Date'] = weekly_summary['Start Date'] + pd.Timedelta(days=6)
         
         # Reorder columns
-        weekly_summary = weekly_summary[['Week', 'Start Date', 'End Date'] + CAKE_TYPES + ['Total Sales']]
-        
-        # Create monthly summary
-        self.sales_data['Month'] = self.sales_data['Date'].dt.month
-        monthly_summary = self.sales_data.groupby(['Year', 'Month']).agg({
-            **{cake: 'sum' for cake in CAKE_TYPES},
-            'Total Sales': 'sum'
-        }).reset_index()
-        
-        # Create day of week summary
-        dow_summary = self.sales_data.groupby('Day of Week').agg({
-            **{cake: 'sum' for cake in CAKE_TYPES},
-            'Total Sales': 'sum'
-        }).reset_index()
-        
-        # Create region summary
-        region_summary = self.sales_data.groupby('Region').agg({
-            **{cake: 'sum' for cake in CAKE_TYPES},
-            'Total Sales': 'sum'
-        }).reset_index()
+        totals = [col for col in weekly_summary.columns if col not in ('Year', 'Week', 'Start Date', 'End Date')]
+        weekly_summary = weekly_summary[['Week', 'Start Date', 'End Date'] + totals]
+        
+        monthly_summary = summaries['monthly']
+        dow_summary = summaries['day_of_week']
+        region_summary = summaries['region']
         
         # Update Excel sheets
+        if not os.path.exists(self.excel_file):
+            self.export_report()
         with pd.ExcelWriter(self.excel_file, engine='openpyxl', mode='a', if_sheet_exists='replace') as writer:
             weekly_summary.to_excel(writer, sheet_name='Weekly Summary', index=False)
             monthly_summary.to_excel(writer, sheet_name='Monthly Analysis', index=False)
@@ -130,54 +251,226 @@ class CakeSalesTracker:
         
         print("Updated summary sheets")
     
-    def train_prediction_model(self):
-        """Train a machine learning model to predict sales"""
-        if not self.load_data():
+    def _incremental_base(self, mode):
+        """Metadata of the model to extend incrementally, or None if a full retrain is needed"""
+        if not self.load_latest_models():
+            reason = "no saved model"
+        elif self.model_mode != mode:
+            reason = f"latest model is {self.model_mode}"
+        elif self.model_metadata.get('incremental_rounds', 0) >= FULL_RETRAIN_EVERY:
+            reason = f"{FULL_RETRAIN_EVERY} incremental rounds since the last one"
+        else:
+            return self.model_metadata
+        print(f"Full retrain: {reason}")
+        return None
+    
+    def train_prediction_model(self, workers=None, mode='per_cake', publish=True, progress=None, incremental=False,
+                               encoding=None):
+        """
+        Train a machine learning model to predict sales
+        
+        Parameters:
+        - workers: Total number of cores to use (defaults to TRAINING_WORKERS).
+          Per-cake models are fitted concurrently and any spare cores go to
+          n_jobs inside each forest, so the two levels never oversubscribe.
+          workers=1 trains one model after another on a single core.
+        - mode: 'per_cake' for one forest per cake type, or 'multi_output'
+          for a single forest predicting every cake type at once
+        - publish: Save the models to the registry as the latest version
+        - progress: Optional callback, called with (model name, {cake type:
+          metrics}) as each model finishes
+        - incremental: Add trees fitted only on sales newer than the latest
+          model's data watermark (warm start) instead of retraining on the
+          full history. Falls back to a full retrain when there is no model
+          of this mode, new regions appeared, or FULL_RETRAIN_EVERY rounds
+          have passed, since the old trees never see the new data. The 20%
+          of each round's rows held out for its metrics are never fitted by
+          later incremental rounds either, only by the next full retrain.
+        - encoding: Region encoding, see feature_encoding (defaults to
+          REGION_ENCODING). An incremental round keeps the encoding and
+          region vocabulary of the model it extends.
+        """
+        if mode not in MODEL_MODES:
+            raise ValueError(f"Unknown model mode '{mode}'; choose from {MODEL_MODES}.")
+        encoding = encoding or REGION_ENCODING
+        
+        base = self._incremental_base(mode) if incremental else None
+        if base is not None and self.feature_encoder.encoding != encoding:
+            print(f"Full retrain: latest model uses {self.feature_encoder.encoding} region encoding")
+            base = None
+        if base is not None:
+            if not self.load_data(since_id=base['data_watermark']):
+                print(f"No new sales since model version {self.model_version}")
+                return
+            if not set(self.sales_data['Region'].unique()) <= set(self.feature_encoder.regions):
+                print("Full retrain: new regions since the last model")
+                base = None
+            elif len(self.sales_data) < MIN_INCREMENTAL_ROWS:
+                print(f"Only {len(self.sales_data)} new rows; keeping model version {self.model_version}")
+                return
+        if base is None and not self.load_data():
             print("No data to train model")
             return
         
-        # Convert date column to datetime if it's not already
-        if not pd.api.types.is_datetime64_any_dtype(self.sales_data['Date']):
-            self.sales_data['Date'] = pd.to_datetime(self.sales_data['Date'])
-        
-        # Create features
-        self.sales_data['DayOfWeek'] = self.sales_data['Date'].dt.dayofweek
-        self.sales_data['Month'] = self.sales_data['Date'].dt.month
-        self.sales_data['DayOfMonth'] = self.sales_data['Date'].dt.day
-        
-        # One-hot encode region
-        region_dummies = pd.get_dummies(self.sales_data['Region'], prefix='Region')
-        self.sales_data = pd.concat([self.sales_data, region_dummies], axis=1)
-        
-        # Train a model for each cake type
+        # Build the features on the side and split once; every cake type uses
+        # the same rows. The target encoding is fitted on the training rows only.
+        train_idx, test_idx = train_test_split(np.arange(len(self.sales_data)), test_size=0.2, random_state=42)
+        if base is None:
+            encoder = FeatureEncoder(encoding)
+            train_rows = self.sales_data.iloc[train_idx]
+            encoder.fit(train_rows['Region'].astype(str), train_rows['Total Sales'])
+        else:
+            encoder = self.feature_encoder
+        X = encoder.transform(self.sales_data['Date'], self.sales_data['Region'].astype(str))
+        X_train, X_test = _take_rows(X, train_idx), _take_rows(X, test_idx)
+        
+        # Split the worker budget between models and trees within each forest
+        workers = max(1, workers or TRAINING_WORKERS)
+        if mode == 'multi_output':
+            targets = {MULTI_OUTPUT_MODEL: CAKE_TYPES}
+        else:
+            targets = {cake_type: [cake_type] for cake_type in CAKE_TYPES}
+        parallel_models = min(workers, len(targets))
+        n_jobs = max(1, workers // parallel_models)
+        
+        def target(columns):
+            # A single cake is fitted on a Series so sklearn treats it as one output
+            return self.sales_data[columns if len(columns) > 1 else columns[0]]
+        
+        start = time.perf_counter()
+        results = []
+        for name, model, mse, mae, seconds in Parallel(n_jobs=parallel_models, prefer='threads', return_as='generator_unordered')(
+            delayed(_fit_cake_model)(
+                name,
+                X_train, X_test,
+                target(columns).iloc[train_idx], target(columns).iloc[test_idx],
+                n_jobs,
+                self.models[name] if base is not None else None,
+            )
+            for name, columns in targets.items()
+        ):
+            results.append((name, model, mse, mae, seconds))
+            if progress is not None:
+                progress(name, {
+                    cake_type: {'mse': cake_mse, 'mae': cake_mae, 'seconds': seconds}
+                    for cake_type, cake_mse, cake_mae in zip(targets[name], mse, mae)
+                })
+        # Keep the models in CAKE_TYPES order whichever finished first
+        order = list(targets)
+        results.sort(key=lambda result: order.index(result[0]))
+        
+        # Store models
+        if base is None:
+            self.training_info = {
+                'training': 'full',
+                'incremental_rounds': 0,
+                'base_version': None,
+                'training_rows': len(train_idx),
+                'evaluation_rows': len(test_idx),
+            }
+        else:
+            # training_rows counts every row any of the model's trees were fitted on
+            self.training_info = {
+                'training': 'incremental',
+                'incremental_rounds': base.get('incremental_rounds', 0) + 1,
+                'base_version': self.model_version,
+                'training_rows': base.get('training_rows', 0) + len(train_idx),
+                'evaluation_rows': len(test_idx),
+            }
+        self._fast_predictor = None
         self.models = {}
+        self.model_mode = mode
+        self.model_targets = targets
+        self.feature_encoder = encoder
+        self.feature_columns = encoder.feature_columns
+        self.training_report = {}
+        for name, model, mse, mae, seconds in results:
+            print(f"{name}: trained in {seconds:.2f}s")
+            self.models[name] = model
+            for cake_type, cake_mse, cake_mae in zip(targets[name], mse, mae):
+                print(f"  {cake_type}: MSE: {cake_mse:.2f}, MAE: {cake_mae:.2f}")
+                self.training_report[cake_type] = {'mse': cake_mse, 'mae': cake_mae, 'seconds': seconds}
+        
+        print(f"Model training complete in {time.perf_counter() - start:.2f}s "
+              f"({self.training_info['training']} {mode} on {X.shape[0]} rows x {X.shape[1]} features, "
+              f"{encoder.encoding} regions, "
+              f"{parallel_models} models at a time, n_jobs={n_jobs} each)")
+        
+        if publish:
+            self.publish_models()
+    
+    def publish_models(self, promote=True):
+        """Save the current models to the registry and make them the latest version"""
+        bundle = {
+            'models': self.models,
+            'model_mode': self.model_mode,
+            'model_targets': self.model_targets,
+            'feature_columns': self.feature_columns,
+            'feature_encoding': self.feature_encoder.to_dict(),
+        }
+        metadata = {
+            'created_at': datetime.now().isoformat(timespec='seconds'),
+            'model_mode': self.model_mode,
+            'feature_columns': self.feature_columns,
+            'feature_encoding': self.feature_encoder.to_dict(),
+            'model_targets': self.model_targets,
+            'data_watermark': self.storage.watermark,
+            **self.training_info,
+            'metrics': self.training_report,
+        }
+        arrays = flatten_forests(self.models, self.model_targets)
+        self.model_version = model_registry.save_version(
+            bundle, metadata, self.model_dir, promote=promote, arrays=arrays
+        )
+        self.model_metadata = metadata
+        print(f"Saved model version {self.model_version}")
+        return self.model_version
+    
+    def load_latest_models(self):
+        """
+        Load the latest promoted model version if it is not the one in memory
         
-        for cake_type in CAKE_TYPES:
-            print(f"Training model for {cake_type}...")
-            
-            # Prepare features and target
-            features = ['DayOfWeek', 'Month', 'DayOfMonth'] + [col for col in self.sales_data.columns if col.startswith('Region_')]
-            X = self.sales_data[features]
-            y = self.sales_data[cake_type]
-            
-            # Split data
-            X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
-            
-            # Train model
-            model = RandomForestRegressor(n_estimators=100, random_state=42)
-            model.fit(X_train, y_train)
-            
-            # Evaluate model
-            y_pred = model.predict(X_test)
-            mse = mean_squared_error(y_test, y_pred)
-            mae = mean_absolute_error(y_test, y_pred)
-            
-            print(f"  MSE: {mse:.2f}, MAE: {mae:.2f}")
-            
-            # Store model
-            self.models[cake_type] = model
+        Only the schema and the tree arrays predict_fast uses are read (see
+        MODEL_MMAP); the forests themselves are loaded on first use.
         
-        print("Model training complete")
+        Returns True if models are available afterwards.
+        """
+        version = model_registry.latest_version(self.model_dir)
+        if version is not None and version != self.model_version:
+            metadata = model_registry.load_metadata(version, self.model_dir)
+            schema, models = metadata, None
+            if 'feature_encoding' not in metadata:
+                # Saved before the schema was kept in the metadata
+                schema, _ = model_registry.load_version(version, self.model_dir)
+                models = schema['models']
+            if 'feature_encoding' in schema:
+                encoder = FeatureEncoder.from_dict(schema['feature_encoding'])
+            else:
+                encoder = FeatureEncoder.from_feature_columns(schema['feature_columns'])
+            arrays = model_registry.load_arrays(version, self.model_dir, mmap=MODEL_MMAP)
+            fast_predictor = FastPredictor(arrays, schema['model_targets'], encoder, version) if arrays else None
+            # Swap the whole version in at once so the lazy models getter never
+            # pairs this version with the previous version's forests
+            with self._model_lock:
+                self._models = models
+                self.model_mode = schema['model_mode']
+                self.model_targets = schema['model_targets']
+                self.feature_columns = schema['feature_columns']
+                self.feature_encoder = encoder
+                self._fast_predictor = fast_predictor
+                self.training_report = metadata['metrics']
+                self.model_metadata = metadata
+                self.model_version = version
+            print(f"Loaded model version {version}")
+        return self.model_version is not None or bool(self._models)
+    
+    def _regions_known(self, regions):
+        """False, with a message, if the loaded model was trained without some of the regions"""
+        unknown = self.feature_encoder.unknown_regions(regions)
+        if unknown:
+            print(f"Model version {self.model_version} was trained without regions {unknown}; retrain required.")
+            return False
+        return True
     
     def predict_next_day(self, date=None, region=None):
         """
@@ -188,9 +481,10 @@ class CakeSalesTracker:
         - region: Region to predict for (required)
         
         Returns:
-        - Dictionary with predicted sales for each cake type
+        - Dictionary with predicted sales for each cake type, or None if there
+          is no model or it was trained without the region
         """
-        if not hasattr(self, 'models') or not self.models:
+        if not self.load_latest_models():
             print("No trained models available. Please train models first.")
             return None
         
@@ -202,61 +496,107 @@ class CakeSalesTracker:
         if region is None:
             print("Region is required for prediction")
             return None
+        if not self._regions_known([region]):
+            return None
         
-        # Create features for prediction
-        features = {
-            'DayOfWeek': date.weekday(),
-            'Month': date.month,
-            'DayOfMonth': date.day
-        }
-        
-        # Add one-hot encoded region
-        for r in REGIONS:
-            features[f'Region_{r}'] = 1 if r == region else 0
-        
-        # Create DataFrame for prediction
-        pred_df = pd.DataFrame([features])
+        pred_df = self.feature_encoder.transform([date], [region])
         
-        # Make predictions for each cake type
+        # Make predictions for each cake type; a multi-output model returns them all at once
         predictions = {}
-        for cake_type, model in self.models.items():
-            pred = model.predict(pred_df)[0]
-            predictions[cake_type] = max(0, round(pred))  # Ensure non-negative and round to nearest integer
+        for name, model in self.models.items():
+            preds = np.atleast_1d(model.predict(pred_df)[0])
+            for cake_type, pred in zip(self.model_targets[name], preds):
+                predictions[cake_type] = max(0, round(pred))  # Ensure non-negative and round to nearest integer
         
         return predictions
     
-    def add_prediction_to_excel(self, date, region, predictions):
+    def predict_fast(self, date=None, region=None, memoize=True):
         """
-        Add prediction to the Excel file
+        Low-latency version of predict_next_day for interactive requests
+        
+        Skips pandas and sklearn's input validation; see fast_inference.
         
         Parameters:
-        - date: Date of prediction
-        - region: Region name
-        - predictions: Dictionary with cake types as keys and predicted quantities as values
+        - date: Date to predict for (defaults to tomorrow)
+        - region: Region to predict for (required)
+        - memoize: Reuse earlier results for the same date, region and model version
+        
+        Returns:
+        - Dictionary with predicted sales for each cake type, or None if there
+          is no model or it was trained without the region
         """
-        if isinstance(date, str):
+        if not self.load_latest_models():
+            print("No trained models available. Please train models first.")
+            return None
+        
+        if date is None:
+            date = datetime.now() + timedelta(days=1)
+        elif isinstance(date, str):
             date = datetime.strptime(date, '%Y-%m-%d')
         
-        day_of_week = DAYS_OF_WEEK[date.weekday()]
+        if region is None:
+            print("Region is required for prediction")
+            return None
+        if not self._regions_known([region]):
+            return None
+        
+        predictor = self._fast_predictor
+        if predictor is None or predictor.version != self.model_version:
+            predictor = FastPredictor.from_models(self.models, self.model_targets, self.feature_encoder, self.model_version)
+            self._fast_predictor = predictor
+        return predictor.predict(date, region, memoize=memoize)
+    
+    def predict_range(self, start, end, regions=None):
+        """
+        Predict sales for every date in a range and every region at once
+        
+        All (date, region) pairs go into one feature matrix, so each model
+        is called once instead of once per pair.
         
-        # Load the workbook
-        workbook = openpyxl.load_workbook(self.excel_file)
-        pred_sheet = workbook['Predictions']
+        Parameters:
+        - start: First date to predict for
+        - end: Last date to predict for (inclusive)
+        - regions: Region names (defaults to every region the model was trained with)
         
-        # Find the next empty row
-        next_row = pred_sheet.max_row + 1
+        Returns:
+        - DataFrame with Date, Region, Cake and Quantity columns, one row per
+          date, region and cake type, or None if there is no model or it was
+          trained without some of the regions
+        """
+        if not self.load_latest_models():
+            print("No trained models available. Please train models first.")
+            return None
         
-        # Add the date, day of week, and region
-        pred_sheet.cell(row=next_row, column=1).value = date
-        pred_sheet.cell(row=next_row, column=2).value = day_of_week
-        pred_sheet.cell(row=next_row, column=3).value = region
+        dates = pd.date_range(pd.to_datetime(start), pd.to_datetime(end), freq='D')
+        regions = list(regions) if regions is not None else self.feature_encoder.regions
+        if not self._regions_known(regions):
+            return None
+        grid = pd.MultiIndex.from_product([dates, regions], names=['Date', 'Region']).to_frame(index=False)
+        features = self.feature_encoder.transform(grid['Date'], grid['Region'])
+        
+        predicted = {}
+        for name, model in self.models.items():
+            preds = model.predict(features).reshape(len(grid), -1)
+            for i, cake_type in enumerate(self.model_targets[name]):
+                predicted[cake_type] = np.maximum(0, np.round(preds[:, i])).astype('int64')
+        
+        wide = pd.concat([grid, pd.DataFrame(predicted)], axis=1)
+        tidy = wide.melt(id_vars=['Date', 'Region'], var_name='Cake', value_name='Quantity')
+        return tidy.sort_values(['Date', 'Region'], kind='stable').reset_index(drop=True)
+    
+    def add_prediction(self, date, region, predictions):
+        """
+        Store a prediction; it is included in the next exported report
         
-        # Add predictions for each cake type
-        for col, cake_type in enumerate(CAKE_TYPES, 4):
-            pred_sheet.cell(row=next_row, column=col).value = predictions.get(cake_type, 0)
+        Parameters:
+        - date: Date of prediction
+        - region: Region name
+        - predictions: Dictionary with cake types as keys and predicted quantities as values
+        """
+        if isinstance(date, str):
+            date = datetime.strptime(date, '%Y-%m-%d')
         
-        # Save the workbook
-        workbook.save(self.excel_file)
+        self.storage.add_predictions(date, region, predictions)
         print(f"Added prediction for {date.strftime('%Y-%m-%d')} in {region}")
     
     def update_dashboard(self):
@@ -265,6 +605,8 @@ class CakeSalesTracker:
             print("No data to update dashboard")
             return
         
+        if not os.path.exists(self.excel_file):
+            self.export_report()
         workbook = openpyxl.load_workbook(self.excel_file)
         dashboard = workbook['Dashboard']
         
@@ -306,7 +648,7 @@ class CakeSalesTracker:
         dashboard.cell(row=3, column=6).value = "Sales by Day of Week"
         dashboard.cell(row=3, column=6).font = Font(bold=True)
         
-        dow_sales = self.sales_data.groupby('Day of Week')['Total Sales'].sum().reset_index()
+        dow_sales = self.sales_data.groupby('Day of Week', observed=True)['Total Sales'].sum().reset_index()
         
         # Reorder days of week
         dow_order = {day: i for i, day in enumerate(DAYS_OF_WEEK)}
@@ -335,7 +677,7 @@ class CakeSalesTracker:
         dashboard.cell(row=15, column=1).value = "Sales by Region"
         dashboard.cell(row=15, column=1).font = Font(bold=True)
         
-        region_sales = self.sales_data.groupby('Region')['Total Sales'].sum().reset_index()
+        region_sales = self.sales_data.groupby('Region', observed=True)['Total Sales'].sum().reset_index()
         
         # Write data for chart
         for i, (region, sales) in enumerate(zip(region_sales['Region'], region_sales['Total Sales'])):
@@ -348,8 +690,8 @@ class CakeSalesTracker:
         chart3.y_axis.title = "Sales"
         chart3.x_axis.title = "Region"
         
-        data = Reference(dashboard, min_col=2, min_row=16, max_row=16+len(REGIONS)-1)
-        cats = Reference(dashboard, min_col=1, min_row=16, max_row=16+len(REGIONS)-1)
+        data = Reference(dashboard, min_col=2, min_row=16, max_row=16+len(region_sales)-1)
+        cats = Reference(dashboard, min_col=1, min_row=16, max_row=16+len(region_sales)-1)
         chart3.add_data(data)
         chart3.set_categories(cats)
         
@@ -430,12 +772,13 @@ if __name__ == "__main__":
     # Train prediction model
     tracker.train_prediction_model()
     
-    # Make prediction for next day
+    # Make predictions for the next two weeks in one batch
     next_day = datetime(2023, 5, 1)
-    for region in REGIONS:
-        predictions = tracker.predict_next_day(next_day, region)
-        if predictions:
-            tracker.add_prediction_to_excel(next_day, region, predictions)
-            print(f"Predictions for {next_day.strftime('%Y-%m-%d')} in {region}:")
+    forecast = tracker.predict_range(next_day, next_day + timedelta(days=13))
+    if forecast is not None:
+        for (day, region), rows in forecast.groupby(['Date', 'Region'], sort=False):
+            predictions = dict(zip(rows['Cake'], rows['Quantity']))
+            tracker.add_prediction(day.to_pydatetime(), region, predictions)
+            print(f"Predictions for {day.strftime('%Y-%m-%d')} in {region}:")
             for cake, quantity in predictions.items():
                 print(f"  {cake}: {quantity}")
\ No newline at end of file
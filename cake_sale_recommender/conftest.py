@@ -0,0 +1,36 @@
+"""
+Shared pytest fixtures
+
+sales_db points the connection pool at a fresh database in a temporary
+directory with two regions, every cake type and 60 days of sales from
+2024-01-01.
+"""
+import os
+from datetime import date, timedelta
+
+import pytest
+
+import database
+from cake_sales_analysis import CAKE_TYPES
+
+REGIONS = ['North', 'South']
+SALES_START = date(2024, 1, 1)
+SALES_DAYS = 60
+
+
+@pytest.fixture
+def sales_db(tmp_path):
+    database.configure_pool(database=os.path.join(tmp_path, 'cake_sales.db'))
+    database.initialize_database()
+    for region in REGIONS:
+        database.add_region(region)
+    for cake in CAKE_TYPES:
+        database.add_cake_type(cake)
+    database.add_sales_bulk(
+        (SALES_START + timedelta(days=offset), region, cake, 10 + (offset + r + c) % 7)
+        for offset in range(SALES_DAYS)
+        for r, region in enumerate(REGIONS)
+        for c, cake in enumerate(CAKE_TYPES)
+    )
+    yield tmp_path
+    database.configure_pool(database=database.DATABASE_NAME)
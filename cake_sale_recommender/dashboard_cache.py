@@ -0,0 +1,136 @@
+"""
+Dashboard metrics and chart data, cached on the data version
+
+The dashboard (totals by cake type, day of week and region plus the key
+metrics) is built from the persisted summary tables and tagged with the
+data_version it was built at. Requests are served from the cached copy
+while the version is unchanged. Once sales have been written the cached
+copy is still returned, marked stale, and a background thread rebuilds
+it, so a page load never waits on a rebuild except the very first one.
+"""
+import threading
+import time
+from datetime import datetime
+
+import database
+import dimension_cache
+from summaries import DAYS_OF_WEEK, load_summaries, update_summary_tables
+
+
+def dashboard_data(summaries, cakes):
+    """
+    Chart data and key metrics from load_summaries() frames
+
+    Returns:
+    - Dictionary with 'cake_sales', 'day_of_week_sales' and 'region_sales'
+      lists of (label, total) pairs and a 'metrics' dictionary
+    """
+    region = summaries['region']
+    cake_sales = [(cake, int(region[cake].sum()) if cake in region else 0) for cake in cakes]
+    dow = summaries['day_of_week'].set_index('Day of Week')['Total Sales']
+    dow_sales = [(day, int(dow.get(day, 0))) for day in DAYS_OF_WEEK]
+    region_sales = sorted((name, int(total)) for name, total in zip(region['Region'], region['Total Sales']))
+
+    metrics = {'Total Sales': sum(sales for _, sales in cake_sales)}
+    if cake_sales and region_sales:
+        metrics['Best Selling Cake'] = max(cake_sales, key=lambda item: item[1])[0]
+        metrics['Best Sales Day'] = max(dow_sales, key=lambda item: item[1])[0]
+        metrics['Best Region'] = max(region_sales, key=lambda item: item[1])[0]
+    return {
+        'cake_sales': cake_sales,
+        'day_of_week_sales': dow_sales,
+        'region_sales': region_sales,
+        'metrics': metrics,
+    }
+
+
+def build_dashboard(cake_types=()):
+    """Bring the summary tables up to date and compute the dashboard from them"""
+    version = database.get_data_version()
+    update_summary_tables()
+    cakes = list(dict.fromkeys(dimension_cache.cake_type_names() + list(cake_types)))
+    dashboard = dashboard_data(load_summaries(cake_types), cakes)
+    dashboard['version'] = version
+    dashboard['built_at'] = datetime.now().isoformat(timespec='seconds')
+    return dashboard
+
+
+class DashboardCache:
+    def __init__(self, cake_types=()):
+        self.cake_types = cake_types
+        self._lock = threading.Lock()
+        self._dashboard = None
+        self._rebuilding = False
+        self.builds = 0
+        self.hits = 0
+        self.stale_hits = 0
+
+    def _rebuild(self, owns_flag):
+        """
+        Build and cache the dashboard
+
+        Parameters:
+        - owns_flag: The caller set _rebuilding for this rebuild, so it is
+          cleared when the rebuild ends; a rebuild run while another one
+          holds the flag leaves it alone
+        """
+        start = time.perf_counter()
+        try:
+            dashboard = build_dashboard(self.cake_types)
+        finally:
+            if owns_flag:
+                with self._lock:
+                    self._rebuilding = False
+        dashboard['build_seconds'] = time.perf_counter() - start
+        with self._lock:
+            # A slower rebuild that started earlier must not replace a newer one
+            if self._dashboard is None or dashboard['version'] >= self._dashboard['version']:
+                self._dashboard = dashboard
+            self.builds += 1
+        return dashboard
+
+    def get(self):
+        """
+        The dashboard for the current data version, or the previous one marked
+        stale while a background rebuild runs
+
+        Returns the dashboard_data() dictionary plus 'version', 'built_at' and 'stale'.
+        """
+        version = database.get_data_version()
+        with self._lock:
+            dashboard = self._dashboard
+            if dashboard is not None:
+                if dashboard['version'] == version:
+                    self.hits += 1
+                    return {**dashboard, 'stale': False}
+                self.stale_hits += 1
+                if not self._rebuilding:
+                    self._rebuilding = True
+                    threading.Thread(
+                        target=self._rebuild, args=(True,), name='dashboard-rebuild', daemon=True
+                    ).start()
+                return {**dashboard, 'stale': True}
+            # Nothing cached yet, so this request has to wait for a build
+            owns_flag = not self._rebuilding
+            self._rebuilding = True
+        return {**self._rebuild(owns_flag), 'stale': False}
+
+    def clear(self):
+        with self._lock:
+            self._dashboard = None
+
+    def stats(self):
+        with self._lock:
+            return {
+                'builds': self.builds,
+                'hits': self.hits,
+                'stale_hits': self.stale_hits,
+                'version': self._dashboard['version'] if self._dashboard else None,
+            }
+
+
+_cache = DashboardCache()
+
+get_dashboard = _cache.get
+clear = _cache.clear
+get_cache_stats = _cache.stats
@@ -1,30 +1,162 @@
+import os
+import queue
 import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import date, datetime
 
-DATABASE_NAME = 'cake_sales.db'
+import dimension_cache
+
+DATABASE_NAME = os.environ.get('CAKE_SALES_DB', 'cake_sales.db')
+
+# Rows per executemany() call when bulk loading sales
+BULK_CHUNK_SIZE = 5000
+
+# Maximum number of idle connections kept open by the pool
+POOL_SIZE = 5
+
+# PRAGMAs run once when a pooled connection is opened. WAL lets the
+# analysis and recommendation readers keep going while sales are written;
+# each setting can be overridden with a CAKE_SALES_<NAME> environment variable.
+CONNECTION_PRAGMAS = {
+    'foreign_keys': 'ON',
+    'journal_mode': os.environ.get('CAKE_SALES_JOURNAL_MODE', 'WAL'),
+    'synchronous': os.environ.get('CAKE_SALES_SYNCHRONOUS', 'NORMAL'),
+    'cache_size': os.environ.get('CAKE_SALES_CACHE_SIZE', '-20000'),  # negative = KiB
+    'mmap_size': os.environ.get('CAKE_SALES_MMAP_SIZE', str(256 * 1024 * 1024)),
+    'temp_store': os.environ.get('CAKE_SALES_TEMP_STORE', 'MEMORY'),
+    'busy_timeout': os.environ.get('CAKE_SALES_BUSY_TIMEOUT', '5000'),  # milliseconds
+}
+
+
+# Callbacks run after sales are committed, with the set of region names
+# touched and a {(sale_date, region_id, cake_id): quantity} dict of what was added
+_sales_listeners = []
+
+def on_sales_written(callback):
+    """Register callback(region_names, daily_totals) to run after add_sale / add_sales_bulk commit"""
+    _sales_listeners.append(callback)
+    return callback
+
+def _notify_sales_written(region_names, daily_totals):
+    for callback in _sales_listeners:
+        callback(region_names, daily_totals)
+
+def _apply_pragmas(conn):
+    for name, value in CONNECTION_PRAGMAS.items():
+        conn.execute(f"PRAGMA {name} = {value}")
+    return conn
+
+
+class ConnectionPool:
+    """Thread-safe pool of SQLite connections with open/reuse counters"""
+
+    def __init__(self, database=DATABASE_NAME, size=POOL_SIZE):
+        self.database = database
+        self.size = size
+        self._idle = queue.LifoQueue(maxsize=size)
+        self._lock = threading.Lock()
+        self.opened = 0
+        self.reused = 0
+        self.closed = 0
+
+    def _open(self):
+        conn = _apply_pragmas(sqlite3.connect(self.database, check_same_thread=False))
+        with self._lock:
+            self.opened += 1
+        return conn
+
+    def acquire(self):
+        """Borrow an idle connection, opening a new one if none is free"""
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            return self._open()
+        with self._lock:
+            self.reused += 1
+        return conn
+
+    def release(self, conn):
+        """Return a connection to the pool, closing it if the pool is full"""
+        if conn.in_transaction:
+            conn.rollback()
+        try:
+            self._idle.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+            with self._lock:
+                self.closed += 1
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def close_all(self):
+        """Close every idle connection"""
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            with self._lock:
+                self.closed += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                'opened': self.opened,
+                'reused': self.reused,
+                'closed': self.closed,
+                'idle': self._idle.qsize(),
+                'size': self.size,
+            }
+
+
+_pool = ConnectionPool()
+
+def configure_pool(database=None, size=None):
+    """Replace the shared pool, e.g. to point at another database file or resize it"""
+    global _pool
+    _pool.close_all()
+    _pool = ConnectionPool(database or _pool.database, size or _pool.size)
+    dimension_cache.invalidate()
+    return _pool
+
+def connection():
+    """Context manager that borrows a connection from the shared pool"""
+    return _pool.connection()
+
+def get_pool_stats():
+    """Connections opened vs. reused by the shared pool"""
+    return _pool.stats()
 
 def get_connection():
-    return sqlite3.connect(DATABASE_NAME)
+    """Borrow a connection from the shared pool; give it back with release_connection()"""
+    return _pool.acquire()
 
-def create_database():
-    conn = sqlite3.connect('cake_sales.db')
-    cursor = conn.cursor()
+def release_connection(conn):
+    """Return a connection from get_connection() to the shared pool"""
+    _pool.release(conn)
 
-def initialize_database():
-    conn = get_connection()
-    cursor = conn.cursor()
-    
+def _migration_base_tables(cursor):
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS regions
                         (id INTEGER PRIMARY KEY AUTOINCREMENT,
                         name TEXT)
                         ''')
-    
+
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS cake_types
                         (id INTEGER PRIMARY KEY AUTOINCREMENT,
                         name TEXT)
                         ''')
-    
+
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS sales (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -36,117 +168,453 @@ def initialize_database():
             FOREIGN KEY (cake_id) REFERENCES cake_types(id)
         )
     ''')
-    conn.commit()
-    conn.close()
-    
+
+def _migration_unique_names(cursor):
+    # Older databases may hold duplicate names; point their sales at the
+    # lowest id and drop the duplicates before adding the unique index
+    for table, column in (('regions', 'region_id'), ('cake_types', 'cake_id')):
+        cursor.execute(f'''
+            UPDATE sales SET {column} = (
+                SELECT MIN(keep.id) FROM {table} keep
+                JOIN {table} dup ON dup.name = keep.name
+                WHERE dup.id = sales.{column}
+            )
+            WHERE {column} IN (SELECT id FROM {table})
+        ''')
+        cursor.execute(f'''
+            DELETE FROM {table}
+            WHERE id NOT IN (SELECT MIN(id) FROM {table} GROUP BY name)
+        ''')
+        cursor.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS idx_{table}_name ON {table} (name)")
+
+def _migration_sales_indexes(cursor):
+    # Covers date-range scans and the all-regions recent-sales aggregation
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_sales_date_region_cake ON sales (sale_date, region_id, cake_id, quantity)")
+    # Covers the per-region recent-sales aggregation and get_sales_by_region
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_sales_region_date_cake ON sales (region_id, sale_date, cake_id, quantity)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_sales_cake ON sales (cake_id)")
+
+def _rebuild_daily_rollup(cursor):
+    cursor.execute("DELETE FROM daily_sales_rollup")
+    cursor.execute('''
+        INSERT INTO daily_sales_rollup (day, region_id, cake_id, qty)
+        SELECT date(sale_date), region_id, cake_id, SUM(quantity)
+        FROM sales
+        GROUP BY date(sale_date), region_id, cake_id
+    ''')
+
+def _migration_daily_rollup(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS daily_sales_rollup (
+            day DATE NOT NULL,
+            region_id INTEGER NOT NULL,
+            cake_id INTEGER NOT NULL,
+            qty INTEGER NOT NULL,
+            PRIMARY KEY (day, region_id, cake_id)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_rollup_region_day ON daily_sales_rollup (region_id, day, cake_id, qty)")
+
+    # Triggers keep the rollup current for every write path into sales
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_sales_rollup_insert AFTER INSERT ON sales
+        BEGIN
+            INSERT INTO daily_sales_rollup (day, region_id, cake_id, qty)
+            VALUES (NEW.sale_date, NEW.region_id, NEW.cake_id, NEW.quantity)
+            ON CONFLICT (day, region_id, cake_id) DO UPDATE SET qty = qty + excluded.qty;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_sales_rollup_delete AFTER DELETE ON sales
+        BEGIN
+            UPDATE daily_sales_rollup SET qty = qty - OLD.quantity
+            WHERE day = OLD.sale_date AND region_id = OLD.region_id AND cake_id = OLD.cake_id;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_sales_rollup_update AFTER UPDATE OF sale_date, region_id, cake_id, quantity ON sales
+        BEGIN
+            UPDATE daily_sales_rollup SET qty = qty - OLD.quantity
+            WHERE day = OLD.sale_date AND region_id = OLD.region_id AND cake_id = OLD.cake_id;
+            INSERT INTO daily_sales_rollup (day, region_id, cake_id, qty)
+            VALUES (NEW.sale_date, NEW.region_id, NEW.cake_id, NEW.quantity)
+            ON CONFLICT (day, region_id, cake_id) DO UPDATE SET qty = qty + excluded.qty;
+        END
+    ''')
+    _rebuild_daily_rollup(cursor)
+
+def _migration_rollup_region_cake_index(cursor):
+    # Lets the all-regions recommendation query seek each (region, cake)
+    # window directly instead of sorting the whole window for GROUP BY
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_rollup_region_cake_day ON daily_sales_rollup (region_id, cake_id, day, qty)")
+
+def _migration_predictions(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS predictions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            prediction_date DATE NOT NULL,
+            region_id INTEGER NOT NULL,
+            cake_id INTEGER NOT NULL,
+            quantity INTEGER NOT NULL,
+            created_at TEXT NOT NULL,
+            FOREIGN KEY (region_id) REFERENCES regions(id),
+            FOREIGN KEY (cake_id) REFERENCES cake_types(id)
+        )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_predictions_date_region ON predictions (prediction_date, region_id)")
+
+def _migration_summary_tables(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS summary_weekly (
+            iso_year INTEGER NOT NULL,
+            iso_week INTEGER NOT NULL,
+            cake_id INTEGER NOT NULL,
+            qty INTEGER NOT NULL,
+            PRIMARY KEY (iso_year, iso_week, cake_id)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS summary_monthly (
+            year INTEGER NOT NULL,
+            month INTEGER NOT NULL,
+            cake_id INTEGER NOT NULL,
+            qty INTEGER NOT NULL,
+            PRIMARY KEY (year, month, cake_id)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS summary_day_of_week (
+            weekday INTEGER NOT NULL,
+            cake_id INTEGER NOT NULL,
+            qty INTEGER NOT NULL,
+            PRIMARY KEY (weekday, cake_id)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS summary_region (
+            region_id INTEGER NOT NULL,
+            cake_id INTEGER NOT NULL,
+            qty INTEGER NOT NULL,
+            PRIMARY KEY (region_id, cake_id)
+        ) WITHOUT ROWID
+    ''')
+    # High-water marks such as the last sales.id folded into the summaries
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS summary_state (
+            name TEXT PRIMARY KEY,
+            value INTEGER NOT NULL
+        )
+    ''')
+
+def _migration_data_version(cursor):
+    # Single-row counter bumped by every write to sales, so caches in any
+    # worker process can tell whether the data changed
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS data_version (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            version INTEGER NOT NULL
+        )
+    ''')
+    cursor.execute("INSERT OR IGNORE INTO data_version (id, version) VALUES (1, 0)")
+
+def _migration_normalize_sale_dates(cursor):
+    # Legacy rows stored as 'YYYY-MM-DD HH:MM:SS' became days of their own in
+    # the rollup. Store plain dates and key the rollup triggers on date(sale_date)
+    # so rows written by other tools cannot split a day again.
+    for trigger in ('trg_sales_rollup_insert', 'trg_sales_rollup_delete', 'trg_sales_rollup_update'):
+        cursor.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+    cursor.execute("UPDATE sales SET sale_date = date(sale_date) WHERE sale_date IS NOT date(sale_date)")
+    cursor.execute('''
+        CREATE TRIGGER trg_sales_rollup_insert AFTER INSERT ON sales
+        BEGIN
+            INSERT INTO daily_sales_rollup (day, region_id, cake_id, qty)
+            VALUES (date(NEW.sale_date), NEW.region_id, NEW.cake_id, NEW.quantity)
+            ON CONFLICT (day, region_id, cake_id) DO UPDATE SET qty = qty + excluded.qty;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER trg_sales_rollup_delete AFTER DELETE ON sales
+        BEGIN
+            UPDATE daily_sales_rollup SET qty = qty - OLD.quantity
+            WHERE day = date(OLD.sale_date) AND region_id = OLD.region_id AND cake_id = OLD.cake_id;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER trg_sales_rollup_update AFTER UPDATE OF sale_date, region_id, cake_id, quantity ON sales
+        BEGIN
+            UPDATE daily_sales_rollup SET qty = qty - OLD.quantity
+            WHERE day = date(OLD.sale_date) AND region_id = OLD.region_id AND cake_id = OLD.cake_id;
+            INSERT INTO daily_sales_rollup (day, region_id, cake_id, qty)
+            VALUES (date(NEW.sale_date), NEW.region_id, NEW.cake_id, NEW.quantity)
+            ON CONFLICT (day, region_id, cake_id) DO UPDATE SET qty = qty + excluded.qty;
+        END
+    ''')
+    _rebuild_daily_rollup(cursor)
+
+def _migration_unique_predictions(cursor):
+    # A prediction generated again for the same date, region and cake type
+    # replaces the earlier one instead of adding a second row; keep the
+    # latest of any duplicates stored before
+    cursor.execute('''
+        DELETE FROM predictions WHERE id NOT IN (
+            SELECT MAX(id) FROM predictions GROUP BY prediction_date, region_id, cake_id
+        )
+    ''')
+    cursor.execute("DROP INDEX IF EXISTS idx_predictions_date_region")
+    cursor.execute(
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_predictions_date_region_cake ON predictions (prediction_date, region_id, cake_id)"
+    )
+
+# Ordered (version, description, step) list; append new steps, never edit applied ones
+MIGRATIONS = [
+    (1, 'base tables', _migration_base_tables),
+    (2, 'unique region and cake type names', _migration_unique_names),
+    (3, 'sales indexes', _migration_sales_indexes),
+    (4, 'daily sales rollup', _migration_daily_rollup),
+    (5, 'rollup (region, cake, day) index', _migration_rollup_region_cake_index),
+    (6, 'predictions table', _migration_predictions),
+    (7, 'summary tables', _migration_summary_tables),
+    (8, 'data version counter', _migration_data_version),
+    (9, 'normalize sale dates', _migration_normalize_sale_dates),
+    (10, 'one prediction per date, region and cake type', _migration_unique_predictions),
+]
+
+def get_schema_version(conn=None):
+    """Return the highest migration version applied to the database"""
+    if conn is None:
+        with connection() as conn:
+            return get_schema_version(conn)
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description TEXT NOT NULL,
+            applied_at TEXT NOT NULL
+        )
+    ''')
+    row = conn.execute("SELECT MAX(version) FROM schema_version").fetchone()
+    return row[0] or 0
+
+def initialize_database():
+    """Create the schema and upgrade an existing database file in place"""
+    with connection() as conn:
+        current = get_schema_version(conn)
+        for version, description, step in MIGRATIONS:
+            if version <= current:
+                continue
+            # Each step runs in its own transaction so a failure leaves the
+            # database at the last fully applied version
+            conn.execute("BEGIN")
+            try:
+                step(conn.cursor())
+                conn.execute(
+                    "INSERT INTO schema_version (version, description, applied_at) VALUES (?, ?, ?)",
+                    (version, description, datetime.now().isoformat(timespec='seconds')),
+                )
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            print(f"Applied migration {version}: {description}")
+
+def _bump_data_version(cursor):
+    cursor.execute("UPDATE data_version SET version = version + 1 WHERE id = 1")
+
+def get_data_version(conn=None):
+    """Counter that changes whenever sales are written, in any process"""
+    if conn is None:
+        with connection() as conn:
+            return get_data_version(conn)
+    return conn.execute("SELECT version FROM data_version WHERE id = 1").fetchone()[0]
+
+def rebuild_daily_rollup():
+    """Recompute daily_sales_rollup from the raw sales table"""
+    with connection() as conn:
+        conn.execute("BEGIN")
+        try:
+            _rebuild_daily_rollup(conn.cursor())
+            _bump_data_version(conn.cursor())
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        return conn.execute("SELECT COUNT(*) FROM daily_sales_rollup").fetchone()[0]
+
 def add_region(region_name):
-    conn = get_connection()
-    cursor = conn.cursor()
-    try:
-        cursor.execute("INSERT INTO regions (name) VALUES (?)", (region_name,))
-        conn.commit()
-    except sqlite3.IntegrityError:
-        print(f"Region '{region_name}' already exists.")
-        pass # Region already exists
-    finally:
-        conn.close()
-        
+    with connection() as conn:
+        try:
+            conn.execute("INSERT INTO regions (name) VALUES (?)", (region_name,))
+            conn.commit()
+            dimension_cache.invalidate()
+        except sqlite3.IntegrityError:
+            print(f"Region '{region_name}' already exists.")
+            pass # Region already exists
+
 def add_cake_type(cake_name):
-    conn = get_connection()
-    cursor = conn.cursor()
-    try:
-        cursor.execute("INSERT INTO cake_types (name) VALUES (?)", (cake_name,))
-        conn.commit()
-    except sqlite3.IntegrityError:
-        print(f"Cake type '{cake_name}' already exists.")
-        pass # Cake type already exists
-    finally:
-        conn.close()
-        
-def add_sale(sale_date, region_name, cake_name, quantity):
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT id FROM regions WHERE name=?", (region_name,))
-    region = cursor.fetchone()
-    if region is None:
-        raise ValueError(f"Region '{region_name}' does not exist.")
-    region_id = region[0]
+    with connection() as conn:
+        try:
+            conn.execute("INSERT INTO cake_types (name) VALUES (?)", (cake_name,))
+            conn.commit()
+            dimension_cache.invalidate()
+        except sqlite3.IntegrityError:
+            print(f"Cake type '{cake_name}' already exists.")
+            pass # Cake type already exists
 
-    cursor.execute("SELECT id FROM cake_types WHERE name=?", (cake_name,))
+def _get_region_id(region_name):
+    region_id = dimension_cache.region_id(region_name)
+    if region_id is None:
+        raise ValueError(f"Region '{region_name}' does not exist.")
+    return region_id
 
-    cake = cursor.fetchone()
-    if cake is None:
+def _get_cake_id(cake_name):
+    cake_id = dimension_cache.cake_id(cake_name)
+    if cake_id is None:
         raise ValueError(f"Cake type '{cake_name}' does not exist.")
-    cake_id = cake[0]    
-    cursor.execute("INSERT INTO sales (sale_date, region_id, cake_id, quantity) VALUES (?, ?, ?, ?)", (sale_date, region_id, cake_id, quantity))    
-    conn.commit()
-    conn.close()
+    return cake_id
+
+def add_sale(sale_date, region_name, cake_name, quantity):
+    region_id = _get_region_id(region_name)
+    cake_id = _get_cake_id(cake_name)
+    with connection() as conn:
+        cursor = conn.cursor()
+        sale_date = _format_sale_date(sale_date)
+        cursor.execute("INSERT INTO sales (sale_date, region_id, cake_id, quantity) VALUES (?, ?, ?, ?)", (sale_date, region_id, cake_id, quantity))
+        _bump_data_version(cursor)
+        conn.commit()
+    _notify_sales_written({region_name}, {(sale_date, region_id, cake_id): quantity})
+
+def _format_sale_date(sale_date):
+    """Store dates as 'YYYY-MM-DD' whatever form they arrive in"""
+    if isinstance(sale_date, datetime):
+        return sale_date.date().isoformat()
+    if isinstance(sale_date, date):
+        return sale_date.isoformat()
+    return datetime.fromisoformat(sale_date).date().isoformat()
+
+def add_sales_bulk(rows, chunk_size=BULK_CHUNK_SIZE):
+    """
+    Insert many sales in a single transaction
+
+    Parameters:
+    - rows: Iterable of (sale_date, region_name, cake_name, quantity) tuples.
+      It is consumed lazily, so a generator can be passed for large backfills.
+    - chunk_size: Number of rows sent to executemany at a time
+
+    Returns:
+    - Number of rows inserted
+    """
+    insert_sql = "INSERT INTO sales (sale_date, region_id, cake_id, quantity) VALUES (?, ?, ?, ?)"
+    inserted = 0
+    chunk = []
+    touched_regions = set()
+    daily_totals = {}
+    start = time.perf_counter()
+    region_ids = dimension_cache.region_ids()
+    cake_ids = dimension_cache.cake_ids()
+    with connection() as conn:
+        cursor = conn.cursor()
+        try:
+            for sale_date, region_name, cake_name, quantity in rows:
+                region_id = region_ids.get(region_name)
+                if region_id is None:
+                    region_id = _get_region_id(region_name)
+                    region_ids[region_name] = region_id
+                touched_regions.add(region_name)
+                cake_id = cake_ids.get(cake_name)
+                if cake_id is None:
+                    cake_id = _get_cake_id(cake_name)
+                    cake_ids[cake_name] = cake_id
+                sale_date = _format_sale_date(sale_date)
+                key = (sale_date, region_id, cake_id)
+                daily_totals[key] = daily_totals.get(key, 0) + quantity
+                chunk.append((sale_date, region_id, cake_id, quantity))
+                if len(chunk) >= chunk_size:
+                    cursor.executemany(insert_sql, chunk)
+                    inserted += len(chunk)
+                    chunk = []
+            if chunk:
+                cursor.executemany(insert_sql, chunk)
+                inserted += len(chunk)
+            if inserted:
+                _bump_data_version(cursor)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+    if touched_regions:
+        _notify_sales_written(touched_regions, daily_totals)
+    elapsed = time.perf_counter() - start
+    rate = inserted / elapsed if elapsed > 0 else float('inf')
+    print(f"Inserted {inserted} sales in {elapsed:.2f}s ({rate:,.0f} rows/s)")
+    return inserted
+
+def add_predictions(prediction_date, region_name, predictions):
+    """
+    Store predicted quantities ({cake_name: quantity}) for one date and region,
+    replacing any earlier prediction for the same date, region and cake type
+    """
+    region_id = _get_region_id(region_name)
+    created_at = datetime.now().isoformat(timespec='seconds')
+    rows = [
+        (_format_sale_date(prediction_date), region_id, _get_cake_id(cake_name), quantity, created_at)
+        for cake_name, quantity in predictions.items()
+    ]
+    with connection() as conn:
+        conn.executemany(
+            '''
+            INSERT INTO predictions (prediction_date, region_id, cake_id, quantity, created_at) VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (prediction_date, region_id, cake_id)
+            DO UPDATE SET quantity = excluded.quantity, created_at = excluded.created_at
+            ''',
+            rows
+        )
+        conn.commit()
 
 def get_sales_by_region(region_name):
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT id FROM regions WHERE name=?", (region_name,))
-    region_id = cursor.fetchone()[0]
-    cursor.execute("SELECT sale_date, cake_id, quantity FROM sales WHERE region_id=?", (region_id,))
-    sales = cursor.fetchall()
-    conn.close()
-    return sales
+    region_id = _get_region_id(region_name)
+    with connection() as conn:
+        cursor = conn.execute("SELECT sale_date, cake_id, quantity FROM sales WHERE region_id=?", (region_id,))
+        return cursor.fetchall()
 
 def get_sales_by_cake_type(cake_name):
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT id FROM cake_types WHERE name=?", (cake_name,))
-    cake_id = cursor.fetchone()[0]
-    cursor.execute("SELECT sale_date, region_id, quantity FROM sales WHERE cake_id=?", (cake_id,))
-    sales = cursor.fetchall()
-    conn.close()
-    return sales
+    cake_id = _get_cake_id(cake_name)
+    with connection() as conn:
+        cursor = conn.execute("SELECT sale_date, region_id, quantity FROM sales WHERE cake_id=?", (cake_id,))
+        return cursor.fetchall()
 
 def get_sales_by_date(sale_date):
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT region_id, cake_id, quantity FROM sales WHERE sale_date=?", (sale_date,))
-    sales = cursor.fetchall()
-    conn.close()
-    return sales
+    with connection() as conn:
+        cursor = conn.execute("SELECT region_id, cake_id, quantity FROM sales WHERE sale_date=?", (_format_sale_date(sale_date),))
+        return cursor.fetchall()
 
 def get_all_sales():
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT sale_date, region_id, cake_id, quantity FROM sales")
-    sales = cursor.fetchall()
-    conn.close()
-    return sales
+    with connection() as conn:
+        cursor = conn.execute("SELECT sale_date, region_id, cake_id, quantity FROM sales")
+        return cursor.fetchall()
 
 def get_all_regions():
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT name FROM regions")
-    regions = cursor.fetchall()
-    conn.close()
-    return regions
+    return [(name,) for name in dimension_cache.region_names()]
 
 def get_all_cake_types():
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT name FROM cake_types")
-    cake_types = cursor.fetchall()
-    conn.close()
-    return cake_types
+    return [(name,) for name in dimension_cache.cake_type_names()]
 
 
 def get_sales_summary():
-    conn = get_connection()
-    cursor = conn.cursor()
-    
-    cursor.execute('''
-        SELECT cakes.name, SUM(sales.quantity) 
-        FROM sales
-        JOIN cake_types ON sales.cake_id = cake_types.id
-        GROUP BY cake_types.name
-        ORDER BY SUM(sales.quantity) DESC
-    ''')
-    
-    results = cursor.fetchall()
-    conn.close()
-    return results
\ No newline at end of file
+    with connection() as conn:
+        cursor = conn.execute('''
+            SELECT cake_types.name, SUM(daily_sales_rollup.qty)
+            FROM daily_sales_rollup
+            JOIN cake_types ON daily_sales_rollup.cake_id = cake_types.id
+            GROUP BY cake_types.name
+            ORDER BY SUM(daily_sales_rollup.qty) DESC
+        ''')
+        return cursor.fetchall()
+
+
+if __name__ == "__main__":
+    import sys
+
+    initialize_database()
+    if sys.argv[1:] == ['rebuild-rollup']:
+        print(f"Rebuilt daily_sales_rollup: {rebuild_daily_rollup()} rows")
+
@@ -0,0 +1,111 @@
+"""
+In-process cache of the regions and cake_types tables
+
+Both tables are tiny and rarely change, so they are loaded once and served
+from dictionaries. database.add_region / add_cake_type invalidate the cache;
+a name that is not found triggers one reload so regions added by another
+worker process are picked up too.
+"""
+import threading
+
+import database
+
+
+class DimensionCache:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._loaded = False
+        self._region_ids = {}
+        self._region_names = {}
+        self._cake_ids = {}
+        self._cake_names = {}
+        self.hits = 0
+        self.misses = 0
+        self.loads = 0
+
+    def _load(self):
+        with database.connection() as conn:
+            regions = conn.execute("SELECT id, name FROM regions ORDER BY id").fetchall()
+            cakes = conn.execute("SELECT id, name FROM cake_types ORDER BY id").fetchall()
+        self._region_names = dict(regions)
+        self._region_ids = {name: id_ for id_, name in regions}
+        self._cake_names = dict(cakes)
+        self._cake_ids = {name: id_ for id_, name in cakes}
+        self._loaded = True
+        self.loads += 1
+
+    def _lookup(self, attr, key):
+        with self._lock:
+            if self._loaded and key in getattr(self, attr):
+                self.hits += 1
+                return getattr(self, attr)[key]
+            self.misses += 1
+            self._load()
+            return getattr(self, attr).get(key)
+
+    def _snapshot(self, attr):
+        with self._lock:
+            if self._loaded:
+                self.hits += 1
+            else:
+                self.misses += 1
+                self._load()
+            return dict(getattr(self, attr))
+
+    def region_id(self, name):
+        """Region id for a name, or None if the region does not exist"""
+        return self._lookup('_region_ids', name)
+
+    def region_name(self, region_id):
+        return self._lookup('_region_names', region_id)
+
+    def cake_id(self, name):
+        """Cake type id for a name, or None if the cake type does not exist"""
+        return self._lookup('_cake_ids', name)
+
+    def cake_name(self, cake_id):
+        return self._lookup('_cake_names', cake_id)
+
+    def region_ids(self):
+        """Copy of the region name -> id mapping"""
+        return self._snapshot('_region_ids')
+
+    def cake_ids(self):
+        """Copy of the cake type name -> id mapping"""
+        return self._snapshot('_cake_ids')
+
+    def region_names(self):
+        """All region names in id order"""
+        return list(self._snapshot('_region_names').values())
+
+    def cake_type_names(self):
+        """All cake type names in id order"""
+        return list(self._snapshot('_cake_names').values())
+
+    def invalidate(self):
+        with self._lock:
+            self._loaded = False
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'loads': self.loads,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
+
+
+_cache = DimensionCache()
+
+region_id = _cache.region_id
+region_name = _cache.region_name
+cake_id = _cache.cake_id
+cake_name = _cache.cake_name
+region_ids = _cache.region_ids
+cake_ids = _cache.cake_ids
+region_names = _cache.region_names
+cake_type_names = _cache.cake_type_names
+invalidate = _cache.invalidate
+get_cache_stats = _cache.stats
@@ -0,0 +1,130 @@
+"""
+Low-latency single-row prediction for trained forests
+
+RandomForestRegressor.predict validates its input and dispatches the trees
+through joblib, which costs milliseconds for a single row. flatten_forests
+copies the nodes of every tree of every model into flat NumPy arrays once
+(the model registry saves them with each version, so they can be
+memory-mapped), and FastPredictor fills one preallocated feature row with the feature encoder saved
+with the model, and walks all trees a level at a time with a
+handful of array operations. The features only depend on calendar fields
+and the region, so results can also be memoized per (date, region, model
+version).
+"""
+import threading
+
+import numpy as np
+
+MEMO_SIZE = 4096
+
+
+def flatten_forests(models, model_targets):
+    """
+    Concatenate all trees of all models, with child indices offset into the
+    combined arrays
+
+    Returns:
+    - {name: array} with the node arrays (left, right, feature, threshold,
+      values), each tree's root node (roots) and the number of trees of each
+      model in model_targets order (model_trees)
+    """
+    left, right, feature, threshold, values, roots, model_trees = [], [], [], [], [], [], []
+    n_outputs = max(len(cake_types) for cake_types in model_targets.values())
+    offset = 0
+    for name in model_targets:
+        estimators = models[name].estimators_
+        for estimator in estimators:
+            tree = estimator.tree_
+            is_leaf = tree.children_left == -1
+            left.append(np.where(is_leaf, -1, tree.children_left + offset))
+            right.append(np.where(is_leaf, -1, tree.children_right + offset))
+            feature.append(np.where(is_leaf, 0, tree.feature))
+            threshold.append(tree.threshold)
+            node_values = np.zeros((tree.node_count, n_outputs))
+            node_values[:, :tree.n_outputs] = tree.value.reshape(tree.node_count, tree.n_outputs)
+            values.append(node_values)
+            roots.append(offset)
+            offset += tree.node_count
+        model_trees.append(len(estimators))
+    return {
+        'left': np.concatenate(left),
+        'right': np.concatenate(right),
+        'feature': np.concatenate(feature),
+        'threshold': np.concatenate(threshold),
+        'values': np.concatenate(values),
+        'roots': np.array(roots),
+        'model_trees': np.array(model_trees),
+    }
+
+
+class FastPredictor:
+    def __init__(self, arrays, model_targets, encoder, version=None, memo_size=MEMO_SIZE):
+        """
+        Parameters:
+        - arrays: flatten_forests() output, possibly memory-mapped
+        - model_targets: {name: [cake types the model predicts, in output order]}
+        - encoder: feature_encoding.FeatureEncoder the models were trained with
+        - version: Model version the predictions are memoized under
+        """
+        self.version = version
+        self.memo_size = memo_size
+        self._lock = threading.Lock()
+        self._memo = {}
+        self.encoder = encoder
+        self._row = np.zeros(len(encoder.feature_columns), dtype=np.float64)
+        self._left = arrays['left']
+        self._right = arrays['right']
+        self._feature = arrays['feature']
+        self._threshold = arrays['threshold']
+        self._values = arrays['values']
+        self._roots = np.asarray(arrays['roots'])
+        self._models = []
+        first_tree = 0
+        for cake_types, trees in zip(model_targets.values(), arrays['model_trees']):
+            self._models.append((cake_types, slice(first_tree, first_tree + int(trees))))
+            first_tree += int(trees)
+
+    @classmethod
+    def from_models(cls, models, model_targets, encoder, version=None, memo_size=MEMO_SIZE):
+        """FastPredictor for fitted forests, {name: RandomForestRegressor}"""
+        return cls(flatten_forests(models, model_targets), model_targets, encoder, version, memo_size)
+
+    def _leaves(self, row):
+        """Leaf index reached by row in every tree"""
+        node = self._roots
+        while True:
+            left = self._left[node]
+            internal = left != -1
+            if not internal.any():
+                return node
+            go_left = row[self._feature[node]] <= self._threshold[node]
+            node = np.where(internal, np.where(go_left, left, self._right[node]), node)
+
+    def _predict_row(self, date, region):
+        row = self._row
+        row.fill(0)
+        self.encoder.fill_row(row, date, region)
+        leaf_values = self._values[self._leaves(row)]
+        predictions = {}
+        for cake_types, trees in self._models:
+            means = leaf_values[trees].mean(axis=0)
+            for cake_type, value in zip(cake_types, means):
+                predictions[cake_type] = max(0, round(value))
+        return predictions
+
+    def predict(self, date, region, memoize=True):
+        """
+        Predicted quantity per cake type for one date and region
+
+        Returns the same dictionary as CakeSalesTracker.predict_next_day.
+        """
+        key = (date.year, date.month, date.day, region, self.version)
+        with self._lock:
+            if memoize and key in self._memo:
+                return dict(self._memo[key])
+            predictions = self._predict_row(date, region)
+            if memoize:
+                if len(self._memo) >= self.memo_size:
+                    self._memo.clear()
+                self._memo[key] = predictions
+        return dict(predictions)
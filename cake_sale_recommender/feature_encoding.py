@@ -0,0 +1,166 @@
+"""
+Feature encoding for the sales models
+
+The models see three calendar features (DayOfWeek, Month, DayOfMonth) and
+the region. How the region is encoded is chosen at training time:
+
+- 'ordinal': one RegionCode column, the region's position in the vocabulary
+- 'target': one RegionMean column, the region's smoothed mean Total Sales
+  over the training rows
+- 'sparse': one Region_<name> column per region in a SciPy CSR matrix
+- 'onehot': the same columns as a dense frame, as models trained before
+  this module used
+
+The dense one-hot frame grows with every region and the forest has to
+scan every column at every split, so with thousands of regions the
+single-column encodings (or 'sparse') are the ones to use.
+
+The region vocabulary is read from the regions table when a model is
+trained and saved with it, so inference builds exactly the columns the
+model was fitted on whatever regions were added since. Regions are kept
+in id order, so existing regions keep their codes when new ones are
+added. A region that is not in the vocabulary cannot be encoded; the
+encoder raises ValueError and the model has to be retrained to cover it.
+"""
+import os
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+import database
+
+ENCODINGS = ('ordinal', 'target', 'sparse', 'onehot')
+REGION_ENCODING = os.environ.get('CAKE_SALES_REGION_ENCODING', 'ordinal')
+
+CALENDAR_COLUMNS = ['DayOfWeek', 'Month', 'DayOfMonth']
+# Weight of the overall mean in a region's target encoding, in rows
+TARGET_SMOOTHING = 10
+
+
+def region_vocabulary():
+    """All region names from the regions table in id order"""
+    with database.connection() as conn:
+        return [name for (name,) in conn.execute("SELECT name FROM regions ORDER BY id")]
+
+
+class FeatureEncoder:
+    def __init__(self, encoding=REGION_ENCODING, regions=None, region_means=None, default_mean=0.0):
+        """
+        Parameters:
+        - encoding: One of ENCODINGS
+        - regions: Region vocabulary (defaults to the regions table)
+        - region_means, default_mean: Fitted target encoding, see fit()
+        """
+        if encoding not in ENCODINGS:
+            raise ValueError(f"Unknown region encoding '{encoding}'; choose from {ENCODINGS}.")
+        self.encoding = encoding
+        self.regions = list(regions) if regions is not None else region_vocabulary()
+        self._codes = {region: code for code, region in enumerate(self.regions)}
+        self._index = pd.Index(self.regions)
+        self.region_means = np.asarray(region_means if region_means is not None else np.zeros(len(self.regions)))
+        self.default_mean = float(default_mean)
+
+    @classmethod
+    def from_dict(cls, state):
+        return cls(state['encoding'], state['regions'], state.get('region_means'), state.get('default_mean', 0.0))
+
+    @classmethod
+    def from_feature_columns(cls, feature_columns):
+        """Encoder for a model saved before encoders were, which used dense one-hot columns"""
+        regions = [column[len('Region_'):] for column in feature_columns if column.startswith('Region_')]
+        return cls('onehot', regions)
+
+    def to_dict(self):
+        """Plain representation saved with the model"""
+        return {
+            'encoding': self.encoding,
+            'regions': self.regions,
+            'region_means': self.region_means.tolist(),
+            'default_mean': self.default_mean,
+        }
+
+    @property
+    def feature_columns(self):
+        if self.encoding == 'ordinal':
+            return CALENDAR_COLUMNS + ['RegionCode']
+        if self.encoding == 'target':
+            return CALENDAR_COLUMNS + ['RegionMean']
+        return CALENDAR_COLUMNS + [f'Region_{region}' for region in self.regions]
+
+    def unknown_regions(self, regions):
+        """Region names that are not in the vocabulary, in first-seen order"""
+        return [region for region in dict.fromkeys(regions) if region not in self._codes]
+
+    def codes(self, regions):
+        """Vocabulary position of each region name; raises ValueError for unknown regions"""
+        codes = self._index.get_indexer(regions).astype('int32')
+        if (codes < 0).any():
+            raise ValueError(f"Regions not in the model's vocabulary: {self.unknown_regions(regions)}; retrain required.")
+        return codes
+
+    def fit(self, regions, totals):
+        """
+        Fit the target encoding on the training rows; a no-op for other encodings
+
+        Parameters:
+        - regions: Region name of each row
+        - totals: Total Sales of each row
+        """
+        if self.encoding != 'target':
+            return self
+        codes = self.codes(regions)
+        totals = np.asarray(totals, dtype=np.float64)
+        self.default_mean = float(totals.mean()) if len(totals) else 0.0
+        sums = np.bincount(codes, weights=totals, minlength=len(self.regions))
+        counts = np.bincount(codes, minlength=len(self.regions))
+        self.region_means = (sums + TARGET_SMOOTHING * self.default_mean) / (counts + TARGET_SMOOTHING)
+        return self
+
+    def transform(self, dates, regions):
+        """
+        Feature matrix for parallel lists of dates and region names
+
+        Returns a DataFrame with feature_columns, or a CSR matrix in the
+        same column order for the 'sparse' encoding.
+        """
+        dates = pd.DatetimeIndex(dates)
+        codes = self.codes(regions)
+        calendar = {
+            'DayOfWeek': dates.dayofweek.astype('int8'),
+            'Month': dates.month.astype('int8'),
+            'DayOfMonth': dates.day.astype('int8'),
+        }
+        if self.encoding == 'ordinal':
+            return pd.DataFrame({**calendar, 'RegionCode': codes})
+        if self.encoding == 'target':
+            return pd.DataFrame({**calendar, 'RegionMean': self.region_means[codes]})
+
+        rows = np.arange(len(codes))
+        if self.encoding == 'sparse':
+            onehot = sparse.csr_matrix(
+                (np.ones(len(rows), dtype=np.float32), (rows, codes)),
+                shape=(len(codes), len(self.regions)),
+            )
+            return sparse.hstack([sparse.csr_matrix(np.column_stack(list(calendar.values()))), onehot],
+                                 format='csr', dtype=np.float32)
+        onehot = np.zeros((len(codes), len(self.regions)), dtype='uint8')
+        onehot[rows, codes] = 1
+        features = pd.DataFrame(calendar)
+        return pd.concat([features, pd.DataFrame(onehot, columns=self.feature_columns[3:])], axis=1)
+
+    def fill_row(self, row, date, region):
+        """Write the features of one date and region into a zeroed float array"""
+        code = self._codes.get(region)
+        if code is None:
+            raise ValueError(f"Region '{region}' is not in the model's vocabulary; retrain required.")
+        row[0] = date.weekday()
+        row[1] = date.month
+        row[2] = date.day
+        if self.encoding == 'ordinal':
+            row[3] = code
+        elif self.encoding == 'target':
+            row[3] = self.region_means[code]
+        else:
+            row[3 + code] = 1
+        return row
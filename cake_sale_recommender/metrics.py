@@ -0,0 +1,98 @@
+"""
+Dashboard key figures computed with aggregate SQL
+
+Every function reads daily_sales_rollup directly, optionally restricted
+to a date range and a region, so a caller polling these figures never
+loads sales into pandas or touches the Excel workbook.
+"""
+from datetime import date
+
+import database
+import dimension_cache
+from summaries import DAYS_OF_WEEK, WEEKDAY_SQL
+
+
+def _filters(start=None, end=None, region=None):
+    """WHERE clause and parameters on daily_sales_rollup d for the given filters"""
+    clauses, params = [], []
+    if start is not None:
+        clauses.append("d.day >= ?")
+        params.append(_iso_date(start))
+    if end is not None:
+        clauses.append("d.day <= ?")
+        params.append(_iso_date(end))
+    if region is not None:
+        region_id = dimension_cache.region_id(region)
+        if region_id is None:
+            raise ValueError(f"Region '{region}' does not exist.")
+        clauses.append("d.region_id = ?")
+        params.append(region_id)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    return where, params
+
+
+def _iso_date(value):
+    if isinstance(value, str):
+        value = date.fromisoformat(value)
+    return value.isoformat()[:10]
+
+
+def sales_by_cake(start=None, end=None, region=None):
+    """[(cake type, quantity), ...], highest first"""
+    where, params = _filters(start, end, region)
+    with database.connection() as conn:
+        totals = conn.execute(
+            f'''
+            SELECT d.cake_id, SUM(d.qty) FROM daily_sales_rollup d {where}
+            GROUP BY d.cake_id
+            ''',
+            params
+        ).fetchall()
+    results = [(dimension_cache.cake_name(cake_id), qty) for cake_id, qty in totals]
+    return sorted(results, key=lambda item: (-item[1], item[0]))
+
+
+def sales_by_region(start=None, end=None, region=None):
+    """[(region, quantity), ...], highest first"""
+    where, params = _filters(start, end, region)
+    with database.connection() as conn:
+        totals = conn.execute(
+            f'''
+            SELECT d.region_id, SUM(d.qty) FROM daily_sales_rollup d {where}
+            GROUP BY d.region_id
+            ''',
+            params
+        ).fetchall()
+    results = [(dimension_cache.region_name(region_id), qty) for region_id, qty in totals]
+    return sorted(results, key=lambda item: (-item[1], item[0]))
+
+
+def sales_by_day_of_week(start=None, end=None, region=None):
+    """[(day name, quantity), ...] from Monday to Sunday, with 0 for days without sales"""
+    where, params = _filters(start, end, region)
+    with database.connection() as conn:
+        totals = dict(conn.execute(
+            f'''
+            SELECT {WEEKDAY_SQL.format(column='d.day')}, SUM(d.qty) FROM daily_sales_rollup d {where}
+            GROUP BY 1
+            ''',
+            params
+        ).fetchall())
+    return [(day, totals.get(weekday, 0)) for weekday, day in enumerate(DAYS_OF_WEEK)]
+
+
+def key_metrics(start=None, end=None, region=None):
+    """
+    Total sales and the best-selling cake, day of week and region
+
+    The best entries are None when there are no sales in the range.
+    """
+    cakes = sales_by_cake(start, end, region)
+    regions = sales_by_region(start, end, region)
+    days = [item for item in sales_by_day_of_week(start, end, region) if item[1]]
+    return {
+        'total_sales': sum(qty for _, qty in cakes),
+        'best_selling_cake': cakes[0][0] if cakes else None,
+        'best_day': max(days, key=lambda item: item[1])[0] if days else None,
+        'best_region': regions[0][0] if regions else None,
+    }
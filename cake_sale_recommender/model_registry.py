@@ -0,0 +1,139 @@
+"""
+Versioned on-disk store for trained prediction models
+
+Each version is a directory under MODEL_DIR holding models.joblib (the
+estimators plus the feature schema they were trained on), metadata.json
+(schema, training data watermark and metrics) and arrays/, the flattened
+tree arrays FastPredictor serves from as raw .npy files. Unpickling a
+scikit-learn forest copies every tree into private memory, so the .npy
+files are what lets worker processes memory-map one copy of a model and
+share its pages. A version
+is written under a temporary name and renamed into place, then promoted
+by atomically replacing the LATEST pointer file, so other worker
+processes only ever see complete versions and can share one model
+instead of each retraining. Saving a version prunes all but the newest
+KEEP_VERSIONS; the promoted version and the one before it are never
+removed, since workers may still be loading them.
+"""
+import json
+import os
+import shutil
+import tempfile
+from datetime import datetime
+
+import joblib
+import numpy as np
+
+MODEL_DIR = os.environ.get('CAKE_SALES_MODEL_DIR', 'models')
+LATEST_FILE = 'LATEST'
+# Versions kept on disk, besides the promoted one and the one before it
+KEEP_VERSIONS = 5
+
+
+def _latest_path(model_dir):
+    return os.path.join(model_dir, LATEST_FILE)
+
+
+def save_version(bundle, metadata, model_dir=MODEL_DIR, promote=True, arrays=None):
+    """
+    Write a new model version and optionally promote it to latest
+
+    Parameters:
+    - bundle: Picklable dict with the models and their feature schema
+    - metadata: JSON-serialisable dict stored next to the models
+    - promote: Point LATEST at the new version once it is fully written
+    - arrays: Optional {name: numpy array} saved as arrays/<name>.npy
+
+    Returns:
+    - The new version id
+    """
+    os.makedirs(model_dir, exist_ok=True)
+    version = datetime.now().strftime('%Y%m%d%H%M%S%f')
+    staging = tempfile.mkdtemp(prefix=f'.{version}-', dir=model_dir)
+    joblib.dump(bundle, os.path.join(staging, 'models.joblib'))
+    if arrays:
+        os.makedirs(os.path.join(staging, 'arrays'))
+        for name, array in arrays.items():
+            np.save(os.path.join(staging, 'arrays', f'{name}.npy'), array)
+    with open(os.path.join(staging, 'metadata.json'), 'w') as f:
+        json.dump({**metadata, 'version': version}, f, indent=2, default=float)
+    os.rename(staging, os.path.join(model_dir, version))
+    if promote:
+        promote_version(version, model_dir)
+    _prune(model_dir)
+    return version
+
+
+def _prune(model_dir):
+    names = list_versions(model_dir)
+    keep = set(names[-KEEP_VERSIONS:])
+    latest = latest_version(model_dir)
+    if latest in names:
+        position = names.index(latest)
+        keep.update(names[max(0, position - 1):position + 1])
+    for name in names:
+        if name not in keep:
+            shutil.rmtree(os.path.join(model_dir, name), ignore_errors=True)
+
+
+def promote_version(version, model_dir=MODEL_DIR):
+    """Atomically make version the one workers load"""
+    if not os.path.isdir(os.path.join(model_dir, version)):
+        raise ValueError(f"Model version '{version}' does not exist.")
+    fd, tmp_path = tempfile.mkstemp(prefix='.latest-', dir=model_dir)
+    with os.fdopen(fd, 'w') as f:
+        f.write(version)
+    os.replace(tmp_path, _latest_path(model_dir))
+
+
+def latest_version(model_dir=MODEL_DIR):
+    """Id of the promoted version, or None if nothing has been saved yet"""
+    try:
+        with open(_latest_path(model_dir)) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def load_metadata(version, model_dir=MODEL_DIR):
+    """metadata.json of a saved version"""
+    with open(os.path.join(model_dir, version, 'metadata.json')) as f:
+        return json.load(f)
+
+
+def load_version(version, model_dir=MODEL_DIR):
+    """
+    Load a saved version's estimators
+
+    Returns:
+    - (bundle, metadata)
+    """
+    bundle = joblib.load(os.path.join(model_dir, version, 'models.joblib'))
+    return bundle, load_metadata(version, model_dir)
+
+
+def load_arrays(version, model_dir=MODEL_DIR, mmap=False):
+    """
+    The arrays saved with a version, or {} for versions saved without any
+
+    Parameters:
+    - mmap: Memory-map the files read-only instead of reading them into
+      memory, so processes loading the same version share the pages
+    """
+    path = os.path.join(model_dir, version, 'arrays')
+    if not os.path.isdir(path):
+        return {}
+    return {
+        name[:-len('.npy')]: np.load(os.path.join(path, name), mmap_mode='r' if mmap else None)
+        for name in os.listdir(path) if name.endswith('.npy')
+    }
+
+
+def list_versions(model_dir=MODEL_DIR):
+    """All complete versions, oldest first"""
+    if not os.path.isdir(model_dir):
+        return []
+    return sorted(
+        name for name in os.listdir(model_dir)
+        if not name.startswith('.') and os.path.isdir(os.path.join(model_dir, name))
+    )
@@ -0,0 +1,87 @@
+"""
+LRU + TTL cache for generate_recommendations results
+
+Entries are keyed on (region, days, top_n). When sales are written for a
+region its entries are dropped, together with the all-regions entries
+(region=None) that include it. The TTL bounds staleness for writes made
+by other worker processes, which this process does not see.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+import database
+
+CACHE_SIZE = 256
+CACHE_TTL_SECONDS = 300
+
+
+class RecommendationCache:
+    def __init__(self, maxsize=CACHE_SIZE, ttl=CACHE_TTL_SECONDS):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key):
+        """Cached value for key, or None if missing or expired"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or time.monotonic() - entry[0] > self.ttl:
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate_regions(self, regions):
+        """Drop entries for the given regions and every all-regions entry"""
+        with self._lock:
+            stale = [key for key in self._entries if key[0] is None or key[0] in regions]
+            for key in stale:
+                del self._entries[key]
+            self.invalidations += len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+                'size': len(self._entries),
+            }
+
+
+_cache = RecommendationCache()
+
+
+@database.on_sales_written
+def _on_sales_written(region_names, daily_totals):
+    _cache.invalidate_regions(region_names)
+
+
+get = _cache.get
+put = _cache.put
+clear = _cache.clear
+get_cache_stats = _cache.stats
@@ -1,43 +1,45 @@
 from datetime import datetime, timedelta
-from database  import get_connection
+from database import connection
+import recommendation_cache
+import rolling_window
 
 def get_recent_sales(region=None, days=30):
     """Get recent sales data for a specific region or all regions"""
-    conn=get_connection()
-    conn=conn.cursor()
+    if rolling_window.tracks_window(days):
+        return rolling_window.window_totals(days, region=region)
     
-    since_date = (datetime.now() - timedelta(days=days).date)
+    since_date = (datetime.now() - timedelta(days=days)).date().isoformat()
     
-    if region:
-        cursor.execute(
-            '''
-            SELECT ct.name, SUM(s.quantity)
-            FROM sales s 
-            JOIN cake_types ct ON s.cake_id = ct.id
-            JOIN regions r ON s.region_id = r.id
-            WHERE r.name = ? AND s.sale_date >= ?
-            GROUP BY ct.name
-            ORDER BY SUM (s.quantity) DESC
-            ''',
-                (region, since_date)
+    with connection() as conn:
+        cursor = conn.cursor()
+        if region:
+            cursor.execute(
+                '''
+                SELECT ct.name, SUM(d.qty)
+                FROM daily_sales_rollup d
+                JOIN cake_types ct ON d.cake_id = ct.id
+                JOIN regions r ON d.region_id = r.id
+                WHERE r.name = ? AND d.day >= ?
+                GROUP BY ct.name
+                ORDER BY SUM (d.qty) DESC, ct.name
+                ''',
+                    (region, since_date)
 
-        )
-    else:
-        cursor.execute(
-            '''
-            SELECT ct.name, SUM(s.quantity)
-            FROM sales s 
-            JOIN cake_types ct ON s.cake_id = ct.id
-            JOIN regions r ON s.region_id = r.id
-            WHERE s.sale_date >= ?
-            GROUP BY ct.name
-            ORDER BY SUM (s.quantity) DESC
-            ''',
-                (since_date,)
+            )
+        else:
+            cursor.execute(
+                '''
+                SELECT ct.name, SUM(d.qty)
+                FROM daily_sales_rollup d
+                JOIN cake_types ct ON d.cake_id = ct.id
+                WHERE d.day >= ?
+                GROUP BY ct.name
+                ORDER BY SUM (d.qty) DESC, ct.name
+                ''',
+                    (since_date,)
 
-        )
-    recent_sales = cursor.fetchall()
-    conn.close()
+            )
+        recent_sales = cursor.fetchall()
     return recent_sales
 
 
@@ -66,14 +68,76 @@ if __name__ == "__main__":
     
 def generate_recommendations(region=None, days=30, top_n=5):
     """Generate recommendations based on recent sales data"""
+    key = (region, days, top_n)
+    cached = recommendation_cache.get(key)
+    if cached is not None:
+        return list(cached)
+
     sales = get_recent_sales(region=region, days=days)
     
     recommendations = []
     for cake_type, total_sales in sales[:top_n]:
         recommend_quantity = int(total_sales * 1.2)  # Increase by 20%
         recommendations.append((cake_type, recommend_quantity))
+    recommendation_cache.put(key, tuple(recommendations))
     return recommendations
 
+def _region_totals_from_rollup(days):
+    """{region: {cake_type: quantity}} over the last `days` days, in one query"""
+    since_date = (datetime.now() - timedelta(days=days)).date().isoformat()
+    
+    with connection() as conn:
+        rows = conn.execute(
+            '''
+            SELECT r.name, ct.name, (
+                SELECT SUM(d.qty) FROM daily_sales_rollup d
+                WHERE d.region_id = r.id AND d.cake_id = ct.id AND d.day >= ?
+            )
+            FROM regions r
+            CROSS JOIN cake_types ct
+            ''',
+            (since_date,)
+        ).fetchall()
+    
+    totals = {}
+    for region, cake_type, total_sales in rows:
+        region_totals = totals.setdefault(region, {})
+        if total_sales is not None:
+            region_totals[cake_type] = total_sales
+    return totals
+
+def generate_all_recommendations(days=30, top_n=5):
+    """
+    Generate recommendations for every region and the global view in one pass
+    
+    Tracked windows are served from the rolling-window totals. Otherwise a
+    single query replaces one generate_recommendations call per region:
+    for every (region, cake) pair it seeks that pair's window in the
+    daily rollup, so the cost does not grow with the length of history.
+    
+    Returns:
+    - Dictionary keyed by region name, plus None for all regions combined,
+      with the same (cake_type, quantity) lists generate_recommendations returns
+    """
+    if rolling_window.tracks_window(days):
+        totals = rolling_window.region_window_totals(days)
+    else:
+        totals = _region_totals_from_rollup(days)
+    
+    overall = {}
+    for cake_totals in totals.values():
+        for cake_type, total_sales in cake_totals.items():
+            overall[cake_type] = overall.get(cake_type, 0) + total_sales
+    totals[None] = overall
+    
+    results = {}
+    for region, cake_totals in totals.items():
+        ranked = sorted(cake_totals.items(), key=lambda item: (-item[1], item[0]))
+        recommendations = [(cake_type, int(total_sales * 1.2)) for cake_type, total_sales in ranked[:top_n]]
+        recommendation_cache.put((region, days, top_n), tuple(recommendations))
+        results[region] = recommendations
+    return results
+
 if __name__ == "__main__":
     print("Recommendations for all regions:")
     print(generate_recommendations())
@@ -0,0 +1,221 @@
+"""
+Streaming Excel report export
+
+Builds the full report (Daily Sales, Predictions, the summary sheets and
+the Dashboard with its charts) with openpyxl's write-only mode, which
+writes each row out as it is appended instead of keeping every cell in
+memory. The daily sales and predictions are read from SQL in chunks and
+pivoted to one column per cake type on the fly; the summary sheets and
+dashboard come from the persisted summary tables, which are small.
+stream_report yields the finished workbook in chunks for an HTTP response.
+"""
+import os
+import tempfile
+from datetime import date
+
+import pandas as pd
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.chart import BarChart, Reference
+from openpyxl.styles import Font
+
+import database
+import dimension_cache
+from dashboard_cache import dashboard_data
+from summaries import iso_week_start, load_summaries, update_summary_tables
+
+CHUNK_SIZE = 5000
+STREAM_BLOCK_SIZE = 64 * 1024
+
+_SALES_SQL = '''
+    SELECT d.day, r.name, ct.name, d.qty
+    FROM daily_sales_rollup d
+    JOIN regions r ON d.region_id = r.id
+    JOIN cake_types ct ON d.cake_id = ct.id
+    ORDER BY d.day, r.name
+'''
+
+_PREDICTIONS_SQL = '''
+    SELECT p.prediction_date, r.name, ct.name, p.quantity
+    FROM predictions p
+    JOIN regions r ON p.region_id = r.id
+    JOIN cake_types ct ON p.cake_id = ct.id
+    ORDER BY p.prediction_date, r.name
+'''
+
+
+def _cake_columns(cake_types):
+    return list(dict.fromkeys(dimension_cache.cake_type_names() + list(cake_types)))
+
+
+def _wide_rows(cursor, cakes, chunk_size, with_total):
+    """
+    Turn (day, region, cake, qty) rows ordered by day and region, one per
+    cake type, into one [Date, Day of Week, Region, cakes..., (Total Sales)]
+    row per day and region
+    """
+    position = {cake: i for i, cake in enumerate(cakes)}
+    key, quantities = None, None
+    while True:
+        chunk = cursor.fetchmany(chunk_size)
+        if not chunk:
+            break
+        for day, region, cake, qty in chunk:
+            if (day, region) != key:
+                if key is not None:
+                    yield _wide_row(key, quantities, with_total)
+                key, quantities = (day, region), [0] * len(cakes)
+            quantities[position[cake]] = qty
+    if key is not None:
+        yield _wide_row(key, quantities, with_total)
+
+
+def _wide_row(key, quantities, with_total):
+    day = date.fromisoformat(key[0])
+    row = [day, day.strftime('%A'), key[1]] + quantities
+    if with_total:
+        row.append(sum(quantities))
+    return row
+
+
+def _stream_sheet(workbook, conn, title, sql, cakes, chunk_size, with_total):
+    sheet = workbook.create_sheet(title)
+    header = ['Date', 'Day of Week', 'Region'] + cakes + (['Total Sales'] if with_total else [])
+    sheet.append(header)
+    rows = 0
+    cursor = conn.execute(sql)
+    for row in _wide_rows(cursor, cakes, chunk_size, with_total):
+        sheet.append(row)
+        rows += 1
+    return rows
+
+
+def _append_frame(workbook, title, frame):
+    sheet = workbook.create_sheet(title)
+    sheet.append(list(frame.columns))
+    for row in frame.itertuples(index=False):
+        sheet.append([value.date() if hasattr(value, 'date') else value for value in row])
+
+
+def _summary_sheets(workbook, summaries):
+    weekly = summaries['weekly'].copy()
+    if weekly.empty:
+        weekly['Start Date'] = weekly['End Date'] = pd.Series(dtype='datetime64[ns]')
+    else:
+        weekly['Start Date'] = iso_week_start(weekly['Year'], weekly['Week'])
+        weekly['End Date'] = weekly['Start Date'] + pd.Timedelta(days=6)
+    totals = [col for col in weekly.columns if col not in ('Year', 'Week', 'Start Date', 'End Date')]
+    _append_frame(workbook, 'Weekly Summary', weekly[['Week', 'Start Date', 'End Date'] + totals])
+    _append_frame(workbook, 'Monthly Analysis', summaries['monthly'])
+    _append_frame(workbook, 'Day of Week Analysis', summaries['day_of_week'])
+    _append_frame(workbook, 'Regional Analysis', summaries['region'])
+
+
+def _dashboard_sheet(workbook, dashboard):
+    """Same layout as CakeSalesTracker.update_dashboard, written row by row"""
+    sheet = workbook.create_sheet('Dashboard')
+    cake_sales = dashboard['cake_sales']
+    dow_sales = dashboard['day_of_week_sales']
+    region_sales = dashboard['region_sales']
+
+    # {row: {column: value or (value, font)}}, filled in and then appended in row order
+    grid = {1: {1: ("Cake Sales Dashboard", Font(size=16, bold=True))}}
+
+    def put(row, column, value):
+        grid.setdefault(row, {})[column] = value
+
+    put(3, 1, ("Total Sales by Cake Type", Font(bold=True)))
+    for i, (cake, sales) in enumerate(cake_sales):
+        put(4 + i, 1, cake)
+        put(4 + i, 2, sales)
+    put(3, 6, ("Sales by Day of Week", Font(bold=True)))
+    for i, (day, sales) in enumerate(dow_sales):
+        put(4 + i, 6, day)
+        put(4 + i, 7, sales)
+    region_row = max(15, 4 + len(cake_sales) + 1)
+    put(region_row, 1, ("Sales by Region", Font(bold=True)))
+    for i, (name, sales) in enumerate(region_sales):
+        put(region_row + 1 + i, 1, name)
+        put(region_row + 1 + i, 2, sales)
+    put(region_row, 6, ("Key Metrics", Font(bold=True)))
+    for i, (label, value) in enumerate(dashboard['metrics'].items()):
+        put(region_row + 1 + i, 6, f"{label}:")
+        put(region_row + 1 + i, 7, value)
+
+    for row in range(1, max(grid) + 1):
+        cells = []
+        columns = grid.get(row, {})
+        for column in range(1, max(columns, default=0) + 1):
+            value = columns.get(column)
+            if isinstance(value, tuple):
+                cell = WriteOnlyCell(sheet, value=value[0])
+                cell.font = value[1]
+                value = cell
+            cells.append(value)
+        sheet.append(cells)
+
+    charts = [
+        ("Total Sales by Cake Type", "Cake Type", 1, 4, len(cake_sales), "D3"),
+        ("Sales by Day of Week", "Day of Week", 6, 4, len(dow_sales), "I3"),
+        ("Sales by Region", "Region", 1, region_row + 1, len(region_sales), f"D{region_row}"),
+    ]
+    for title, axis_title, column, first_row, count, anchor in charts:
+        if not count:
+            continue
+        chart = BarChart()
+        chart.title = title
+        chart.y_axis.title = "Sales"
+        chart.x_axis.title = axis_title
+        chart.add_data(Reference(sheet, min_col=column + 1, min_row=first_row, max_row=first_row + count - 1))
+        chart.set_categories(Reference(sheet, min_col=column, min_row=first_row, max_row=first_row + count - 1))
+        sheet.add_chart(chart, anchor)
+
+
+def write_report(output, cake_types=(), chunk_size=CHUNK_SIZE):
+    """
+    Write the full report workbook
+
+    Parameters:
+    - output: File path or binary file object
+    - cake_types: Cake types that always get a column
+    - chunk_size: Rows fetched from SQLite at a time
+
+    Returns:
+    - Number of daily sales rows written
+    """
+    if isinstance(output, str) and os.path.dirname(output):
+        os.makedirs(os.path.dirname(output), exist_ok=True)
+    update_summary_tables()
+    summaries = load_summaries(cake_types)
+    cakes = _cake_columns(cake_types)
+
+    workbook = Workbook(write_only=True)
+    with database.connection() as conn:
+        sales_rows = _stream_sheet(workbook, conn, 'Daily Sales', _SALES_SQL, cakes, chunk_size, True)
+        _stream_sheet(workbook, conn, 'Predictions', _PREDICTIONS_SQL, cakes, chunk_size, False)
+    _summary_sheets(workbook, summaries)
+    _dashboard_sheet(workbook, dashboard_data(summaries, cakes))
+    workbook.save(output)
+    print(f"Exported {sales_rows} daily sales rows to {output if isinstance(output, str) else 'stream'}")
+    return sales_rows
+
+
+def stream_report(cake_types=(), chunk_size=CHUNK_SIZE, block_size=STREAM_BLOCK_SIZE):
+    """
+    Generate the report and yield it in blocks of bytes
+
+    The workbook is written to a temporary file, which is removed once the
+    last block has been sent (or the consumer stops early).
+    """
+    fd, path = tempfile.mkstemp(prefix='cake_report_', suffix='.xlsx')
+    try:
+        with os.fdopen(fd, 'w+b') as f:
+            write_report(f, cake_types, chunk_size)
+            f.seek(0)
+            while True:
+                block = f.read(block_size)
+                if not block:
+                    break
+                yield block
+    finally:
+        os.remove(path)
@@ -0,0 +1,175 @@
+"""
+Incremental rolling-window sales totals
+
+Keeps per-(region, cake) totals for several window lengths at once. New
+sales are folded in as they are written, and when the date moves on the
+days leaving each window are subtracted, so a window query costs
+O(regions x cakes) however much history is stored. The state is rebuilt
+from daily_sales_rollup on first use and every REBUILD_INTERVAL_SECONDS,
+which also picks up sales written by other worker processes.
+
+A window of N days covers sale dates from today - N through any future
+dates, the same range get_recent_sales(days=N) queries.
+"""
+import threading
+import time
+from datetime import date, timedelta
+
+import database
+import dimension_cache
+
+WINDOWS = (7, 30, 90)
+REBUILD_INTERVAL_SECONDS = 300
+
+
+class RollingWindowAggregator:
+    def __init__(self, windows=WINDOWS, rebuild_interval=REBUILD_INTERVAL_SECONDS):
+        self.windows = tuple(sorted(windows))
+        self.rebuild_interval = rebuild_interval
+        self.enabled = True
+        self._lock = threading.RLock()
+        self._today = None
+        self._built_at = None
+        # day -> {(region_id, cake_id): qty} for every day still inside the longest window
+        self._days = {}
+        # window -> {region_id: {cake_id: [qty, contributing days]}}
+        self._totals = {window: {} for window in self.windows}
+
+    def _apply(self, window, day_totals, sign):
+        totals = self._totals[window]
+        for (region_id, cake_id), qty in day_totals.items():
+            region_totals = totals.setdefault(region_id, {})
+            entry = region_totals.setdefault(cake_id, [0, 0])
+            entry[0] += sign * qty
+            entry[1] += sign
+            if entry[1] == 0:
+                del region_totals[cake_id]
+                if not region_totals:
+                    del totals[region_id]
+
+    def _add_day(self, day, day_totals):
+        bucket = self._days.setdefault(day, {})
+        for key, qty in day_totals.items():
+            if key in bucket:
+                bucket[key] += qty
+                for window in self.windows:
+                    if day >= self._today - timedelta(days=window):
+                        self._totals[window][key[0]][key[1]][0] += qty
+            else:
+                bucket[key] = qty
+                for window in self.windows:
+                    if day >= self._today - timedelta(days=window):
+                        self._apply(window, {key: qty}, 1)
+
+    def rebuild(self, today=None):
+        """Reload every window from daily_sales_rollup"""
+        today = today or date.today()
+        since = today - timedelta(days=self.windows[-1])
+        with database.connection() as conn:
+            rows = conn.execute(
+                "SELECT day, region_id, cake_id, qty FROM daily_sales_rollup WHERE day >= ?",
+                (since.isoformat(),)
+            ).fetchall()
+        with self._lock:
+            self._today = today
+            self._days = {}
+            self._totals = {window: {} for window in self.windows}
+            for day, region_id, cake_id, qty in rows:
+                self._add_day(date.fromisoformat(day), {(region_id, cake_id): qty})
+            self._built_at = time.monotonic()
+        return len(rows)
+
+    def advance(self, today=None):
+        """Move the windows forward to today, subtracting the days that fall out"""
+        today = today or date.today()
+        with self._lock:
+            if self._today is None or today <= self._today:
+                return
+            for window in self.windows:
+                old_start = self._today - timedelta(days=window)
+                new_start = today - timedelta(days=window)
+                for day in [d for d in self._days if old_start <= d < new_start]:
+                    self._apply(window, self._days[day], -1)
+            oldest = today - timedelta(days=self.windows[-1])
+            for day in [d for d in self._days if d < oldest]:
+                del self._days[day]
+            self._today = today
+
+    def add_sales(self, daily_totals):
+        """Fold in {(sale_date, region_id, cake_id): quantity} from a committed write"""
+        with self._lock:
+            if self._today is None:
+                return
+            since = self._today - timedelta(days=self.windows[-1])
+            for (sale_date, region_id, cake_id), qty in daily_totals.items():
+                day = date.fromisoformat(sale_date)
+                if day >= since:
+                    self._add_day(day, {(region_id, cake_id): qty})
+
+    def _refresh(self):
+        if self._built_at is None or time.monotonic() - self._built_at > self.rebuild_interval:
+            self.rebuild()
+        else:
+            self.advance()
+
+    def totals(self, window, region=None):
+        """
+        Sales per cake type over a window, highest first
+
+        Returns the same [(cake_type, quantity), ...] list as get_recent_sales.
+        """
+        if window not in self._totals:
+            raise ValueError(f"Window of {window} days is not tracked; choose from {self.windows}.")
+        region_id = None
+        if region:
+            region_id = dimension_cache.region_id(region)
+            if region_id is None:
+                return []
+        with self._lock:
+            self._refresh()
+            totals = self._totals[window]
+            region_totals = [totals.get(region_id, {})] if region_id is not None else totals.values()
+            by_cake = {}
+            for cake_totals in region_totals:
+                for cake_id, (qty, _) in cake_totals.items():
+                    by_cake[cake_id] = by_cake.get(cake_id, 0) + qty
+        results = [(dimension_cache.cake_name(cake_id), qty) for cake_id, qty in by_cake.items()]
+        return sorted(results, key=lambda item: (-item[1], item[0]))
+
+    def totals_by_region(self, window):
+        """{region_name: {cake_type: quantity}} over a window for every region"""
+        if window not in self._totals:
+            raise ValueError(f"Window of {window} days is not tracked; choose from {self.windows}.")
+        with self._lock:
+            self._refresh()
+            snapshot = {
+                region_id: {cake_id: qty for cake_id, (qty, _) in cake_totals.items()}
+                for region_id, cake_totals in self._totals[window].items()
+            }
+        return {
+            region: {dimension_cache.cake_name(cake_id): qty for cake_id, qty in snapshot.get(region_id, {}).items()}
+            for region, region_id in dimension_cache.region_ids().items()
+        }
+
+
+_aggregator = RollingWindowAggregator()
+
+
+@database.on_sales_written
+def _on_sales_written(region_names, daily_totals):
+    _aggregator.add_sales(daily_totals)
+
+
+rebuild = _aggregator.rebuild
+window_totals = _aggregator.totals
+region_window_totals = _aggregator.totals_by_region
+
+
+def tracks_window(days):
+    """True if get_recent_sales(days=days) can be served from the rolling windows"""
+    return _aggregator.enabled and days in _aggregator.windows
+
+
+def set_enabled(enabled):
+    """Switch the rolling windows on or off, e.g. to compare with the SQL path"""
+    _aggregator.enabled = enabled
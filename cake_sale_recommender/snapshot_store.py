@@ -0,0 +1,263 @@
+"""
+Columnar Parquet snapshots of the daily sales history
+
+write_snapshot() copies daily_sales_rollup into a Parquet dataset
+partitioned by month (hive layout, month=YYYY-MM), streaming it from
+SQLite in chunks, and records the sales.id watermark it covers. Region is
+a dictionary-encoded column rather than a second partition level: one
+file per month and region meant thousands of tiny files whose open cost
+outweighed the pruning. Readers load only the months and columns they ask
+for, with region filters pushed down into the scan, and add
+a delta from SQLite: the rollup rows of every (day, region) that sales
+newer than the watermark were recorded for, which replace the snapshot's
+rows for that day and region. Sales edited or deleted after a snapshot are
+only reflected once the next snapshot is written, so write one
+periodically (`python snapshot_store.py`, e.g. nightly from cron).
+
+Each snapshot is written to its own directory and promoted by atomically
+replacing the LATEST pointer, as in model_registry. pyarrow is optional:
+without it, or before the first snapshot, SnapshotSalesStorage reads
+from SQLite like SQLiteSalesStorage.
+"""
+import json
+import os
+import shutil
+import tempfile
+from datetime import date, datetime
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+except ImportError:
+    pa = None
+    ds = None
+
+import database
+from storage import SQLiteSalesStorage
+
+SNAPSHOT_DIR = os.environ.get('CAKE_SALES_SNAPSHOT_DIR', 'snapshots')
+LATEST_FILE = 'LATEST'
+MANIFEST_FILE = 'snapshot.json'
+CHUNK_SIZE = 100000
+# Older snapshots kept around for readers that are still using them
+KEEP_SNAPSHOTS = 2
+
+COLUMNS = ('day', 'region', 'cake', 'qty')
+
+_ROLLUP_SQL = '''
+    SELECT d.day, r.name, ct.name, d.qty
+    FROM daily_sales_rollup d{join}
+    JOIN regions r ON d.region_id = r.id
+    JOIN cake_types ct ON d.cake_id = ct.id
+    {where}
+'''
+
+_NEW_DAYS_JOIN = '''
+    JOIN (SELECT DISTINCT date(sale_date) AS sale_date, region_id FROM sales WHERE id > ?) n
+      ON n.sale_date = d.day AND n.region_id = d.region_id'''
+
+
+def available():
+    """True if pyarrow is installed"""
+    return pa is not None
+
+
+def _schema():
+    return pa.schema([
+        ('day', pa.date32()),
+        ('region', pa.string()),
+        ('cake', pa.string()),
+        ('qty', pa.int64()),
+        ('month', pa.string()),
+    ])
+
+
+def _partitioning():
+    return ds.partitioning(pa.schema([('month', pa.string())]), flavor='hive')
+
+
+def _dataset(path):
+    return ds.dataset(os.path.join(path, 'data'), format='parquet', partitioning=_partitioning())
+
+
+def _batches(cursor, chunk_size):
+    schema = _schema()
+    while True:
+        rows = cursor.fetchmany(chunk_size)
+        if not rows:
+            break
+        days = [date.fromisoformat(row[0]) for row in rows]
+        yield pa.record_batch([
+            pa.array(days, pa.date32()),
+            pa.array([row[1] for row in rows], pa.string()),
+            pa.array([row[2] for row in rows], pa.string()),
+            pa.array([row[3] for row in rows], pa.int64()),
+            pa.array([day.strftime('%Y-%m') for day in days], pa.string()),
+        ], schema=schema)
+
+
+def latest_snapshot(snapshot_dir=SNAPSHOT_DIR):
+    """Manifest of the promoted snapshot (with its 'path'), or None"""
+    try:
+        with open(os.path.join(snapshot_dir, LATEST_FILE)) as f:
+            name = f.read().strip()
+        with open(os.path.join(snapshot_dir, name, MANIFEST_FILE)) as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        return None
+    manifest['path'] = os.path.join(snapshot_dir, name)
+    return manifest
+
+
+def write_snapshot(snapshot_dir=SNAPSHOT_DIR, chunk_size=CHUNK_SIZE):
+    """
+    Write the full daily sales history as a new snapshot and promote it
+
+    Returns:
+    - The snapshot manifest
+    """
+    if pa is None:
+        raise RuntimeError("Writing snapshots requires pyarrow (pip install pyarrow).")
+    os.makedirs(snapshot_dir, exist_ok=True)
+    name = datetime.now().strftime('%Y%m%d%H%M%S%f')
+    staging = tempfile.mkdtemp(prefix=f'.{name}-', dir=snapshot_dir)
+    try:
+        with database.connection() as conn:
+            # One read transaction so the watermark matches the rows written
+            conn.execute("BEGIN")
+            watermark = conn.execute("SELECT COALESCE(MAX(id), 0) FROM sales").fetchone()[0]
+            cursor = conn.execute(_ROLLUP_SQL.format(join='', where='ORDER BY d.day, r.name'))
+            ds.write_dataset(
+                _batches(cursor, chunk_size),
+                os.path.join(staging, 'data'),
+                schema=_schema(),
+                format='parquet',
+                partitioning=_partitioning(),
+                existing_data_behavior='error',
+            )
+        manifest = {
+            'created_at': datetime.now().isoformat(timespec='seconds'),
+            'watermark': watermark,
+            'rows': _dataset(staging).count_rows(),
+        }
+        with open(os.path.join(staging, MANIFEST_FILE), 'w') as f:
+            json.dump(manifest, f, indent=2)
+        os.rename(staging, os.path.join(snapshot_dir, name))
+    except Exception:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+
+    fd, tmp_path = tempfile.mkstemp(prefix='.latest-', dir=snapshot_dir)
+    with os.fdopen(fd, 'w') as f:
+        f.write(name)
+    os.replace(tmp_path, os.path.join(snapshot_dir, LATEST_FILE))
+    _prune(snapshot_dir)
+    print(f"Wrote snapshot {name}: {manifest['rows']} rows up to sale {watermark}")
+    return {**manifest, 'path': os.path.join(snapshot_dir, name)}
+
+
+def _prune(snapshot_dir):
+    names = sorted(
+        name for name in os.listdir(snapshot_dir)
+        if not name.startswith('.') and os.path.isdir(os.path.join(snapshot_dir, name))
+    )
+    for name in names[:-KEEP_SNAPSHOTS]:
+        shutil.rmtree(os.path.join(snapshot_dir, name), ignore_errors=True)
+
+
+def _snapshot_filter(start, end, regions):
+    expression = None
+    conditions = []
+    if start is not None:
+        conditions += [ds.field('month') >= start.strftime('%Y-%m'), ds.field('day') >= pa.scalar(start, pa.date32())]
+    if end is not None:
+        conditions += [ds.field('month') <= end.strftime('%Y-%m'), ds.field('day') <= pa.scalar(end, pa.date32())]
+    if regions is not None:
+        conditions.append(ds.field('region').isin(list(regions)))
+    for condition in conditions:
+        expression = condition if expression is None else expression & condition
+    return expression
+
+
+def _delta(conn, watermark, start, end, regions):
+    """Current rollup rows for every (day, region) with sales newer than watermark"""
+    clauses, params = [], [watermark]
+    if start is not None:
+        clauses.append("d.day >= ?")
+        params.append(start.isoformat())
+    if end is not None:
+        clauses.append("d.day <= ?")
+        params.append(end.isoformat())
+    if regions is not None:
+        clauses.append(f"r.name IN ({', '.join('?' * len(regions))})")
+        params.extend(regions)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    rows = conn.execute(_ROLLUP_SQL.format(join=_NEW_DAYS_JOIN, where=where), params).fetchall()
+    delta = pd.DataFrame(rows, columns=list(COLUMNS))
+    delta['day'] = pd.to_datetime(delta['day'])
+    return delta
+
+
+def load_daily_sales(columns=COLUMNS, start=None, end=None, regions=None, snapshot_dir=SNAPSHOT_DIR):
+    """
+    Daily sales in long form from the latest snapshot plus the SQLite delta
+
+    Parameters:
+    - columns: Subset of ('day', 'region', 'cake', 'qty') to return
+    - start, end: Optional inclusive date range; only matching month
+      partitions are read
+    - regions: Optional region names to filter on
+
+    Returns:
+    - (DataFrame, watermark), or None without pyarrow or a snapshot
+    """
+    manifest = latest_snapshot(snapshot_dir) if pa is not None else None
+    if manifest is None:
+        return None
+    start = pd.Timestamp(start).date() if start is not None else None
+    end = pd.Timestamp(end).date() if end is not None else None
+    regions = list(regions) if regions is not None else None
+    columns = list(columns)
+
+    with database.connection() as conn:
+        conn.execute("BEGIN")
+        watermark = conn.execute("SELECT COALESCE(MAX(id), 0) FROM sales").fetchone()[0]
+        delta = _delta(conn, manifest['watermark'], start, end, regions)
+
+    # The delta replaces whole (day, region) groups, so those two columns are
+    # read even if the caller did not ask for them
+    read_columns = list(dict.fromkeys(columns + (['day', 'region'] if len(delta) else [])))
+    table = _dataset(manifest['path']).to_table(columns=read_columns, filter=_snapshot_filter(start, end, regions))
+    snapshot = table.to_pandas()
+    if 'day' in snapshot:
+        snapshot['day'] = pd.to_datetime(snapshot['day'])
+
+    if len(delta):
+        replaced = pd.MultiIndex.from_frame(delta[['day', 'region']].drop_duplicates())
+        keep = ~pd.MultiIndex.from_frame(snapshot[['day', 'region']]).isin(replaced)
+        snapshot = pd.concat([snapshot[keep], delta[read_columns]], ignore_index=True)
+    return snapshot[columns], watermark
+
+
+class SnapshotSalesStorage(SQLiteSalesStorage):
+    """SQLiteSalesStorage that reads the sales history from the Parquet snapshot when there is one"""
+
+    def __init__(self, snapshot_dir=SNAPSHOT_DIR):
+        self.snapshot_dir = snapshot_dir
+
+    def load_sales(self, cake_types=(), since_id=None):
+        loaded = None
+        if since_id is None:
+            loaded = load_daily_sales(snapshot_dir=self.snapshot_dir)
+        if loaded is None:
+            return super().load_sales(cake_types, since_id=since_id)
+        sales, self.watermark = loaded
+        sales = sales.rename(columns={'day': 'Date', 'region': 'Region', 'cake': 'Cake', 'qty': 'Quantity'})
+        return self._sales_frame(sales.astype({'Region': 'object', 'Cake': 'object'}), cake_types)
+
+
+if __name__ == "__main__":
+    database.initialize_database()
+    write_snapshot()
@@ -0,0 +1,139 @@
+"""
+Storage backends for CakeSalesTracker
+
+The tracker reads and writes through a SalesStorage object instead of an
+Excel workbook. SQLiteSalesStorage is built on database.py; Excel is only
+an export target (export_to_excel for any storage, report_export for the
+streaming SQLite export).
+"""
+import os
+
+import pandas as pd
+
+import database
+import dimension_cache
+
+
+class SalesStorage:
+    """Interface the tracker uses to read and write sales and predictions"""
+
+    def load_sales(self, cake_types=(), since_id=None):
+        """
+        Load daily sales as one row per (date, region)
+
+        Columns are Date, Day of Week, Region, one column per cake type and
+        Total Sales. cake_types are always present as columns, filled with 0
+        if the database has no sales for them. Afterwards self.watermark is
+        the id of the last sale included.
+
+        With since_id, only the (date, region) rows that sales with a higher
+        id were recorded for are loaded, with their full daily totals.
+        """
+        raise NotImplementedError
+
+    def add_daily_sales(self, date, region, sales_dict):
+        raise NotImplementedError
+
+    def load_predictions(self, cake_types=()):
+        """Load the latest prediction per date, region and cake type, in the load_sales layout without Total Sales"""
+        raise NotImplementedError
+
+    def add_predictions(self, date, region, predictions):
+        raise NotImplementedError
+
+
+def _to_wide(long_df, cake_types, index_columns):
+    """Pivot (index..., Cake, Quantity) rows, one per index and cake type, into one column per cake type"""
+    columns = list(dict.fromkeys(dimension_cache.cake_type_names() + list(cake_types)))
+    if long_df.empty:
+        wide = pd.DataFrame(columns=index_columns + columns)
+        wide['Date'] = pd.to_datetime(wide['Date'])
+    else:
+        wide = long_df.pivot(index=index_columns, columns='Cake', values='Quantity')
+        wide = wide.reindex(columns=columns).fillna(0).reset_index()
+        wide.columns.name = None
+    wide[columns] = wide[columns].astype('int64')
+    wide.insert(1, 'Day of Week', wide['Date'].dt.day_name())
+    return wide, columns
+
+
+class SQLiteSalesStorage(SalesStorage):
+    watermark = 0
+
+    def load_sales(self, cake_types=(), since_id=None):
+        new_rows = ''
+        params = ()
+        if since_id is not None:
+            new_rows = '''
+                JOIN (SELECT DISTINCT date(sale_date) AS sale_date, region_id FROM sales WHERE id > ?) n
+                  ON n.sale_date = d.day AND n.region_id = d.region_id'''
+            params = (since_id,)
+        with database.connection() as conn:
+            # One read transaction so the watermark matches the rows loaded
+            conn.execute("BEGIN")
+            watermark = conn.execute("SELECT COALESCE(MAX(id), 0) FROM sales").fetchone()[0]
+            sales = pd.read_sql(
+                f'''
+                SELECT d.day AS "Date", r.name AS "Region", ct.name AS "Cake", d.qty AS "Quantity"
+                FROM daily_sales_rollup d{new_rows}
+                JOIN regions r ON d.region_id = r.id
+                JOIN cake_types ct ON d.cake_id = ct.id
+                ORDER BY d.day, r.id
+                ''',
+                conn,
+                params=params,
+                parse_dates=['Date'],
+                dtype={'Region': 'object', 'Cake': 'object', 'Quantity': 'int64'},
+            )
+        self.watermark = watermark
+        return self._sales_frame(sales, cake_types)
+
+    def _sales_frame(self, sales, cake_types):
+        """Wide load_sales frame from (Date, Region, Cake, Quantity) rows"""
+        wide, columns = _to_wide(sales, cake_types, ['Date', 'Region'])
+        wide['Total Sales'] = wide[columns].sum(axis=1).astype('int64')
+        return wide
+
+    def add_daily_sales(self, date, region, sales_dict):
+        rows = [(date, region, cake_type, quantity) for cake_type, quantity in sales_dict.items()]
+        return database.add_sales_bulk(rows)
+
+    def load_predictions(self, cake_types=()):
+        with database.connection() as conn:
+            predictions = pd.read_sql(
+                '''
+                SELECT p.prediction_date AS "Date", r.name AS "Region", ct.name AS "Cake",
+                       p.quantity AS "Quantity"
+                FROM predictions p
+                JOIN regions r ON p.region_id = r.id
+                JOIN cake_types ct ON p.cake_id = ct.id
+                ORDER BY p.id
+                ''',
+                conn,
+                parse_dates=['Date'],
+                dtype={'Region': 'object', 'Cake': 'object', 'Quantity': 'int64'},
+            )
+        wide, _ = _to_wide(predictions, cake_types, ['Date', 'Region'])
+        return wide
+
+    def add_predictions(self, date, region, predictions):
+        database.add_predictions(date, region, predictions)
+
+
+def export_to_excel(storage, excel_file, cake_types=()):
+    """
+    Write the Daily Sales and Predictions sheets to a fresh workbook
+
+    An empty Dashboard sheet is added for update_dashboard to fill in.
+    """
+    sales = storage.load_sales(cake_types)
+    predictions = storage.load_predictions(cake_types)
+    directory = os.path.dirname(excel_file)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with pd.ExcelWriter(excel_file, engine='openpyxl', mode='w') as writer:
+        sales.to_excel(writer, sheet_name='Daily Sales', index=False)
+        predictions.to_excel(writer, sheet_name='Predictions', index=False)
+        pd.DataFrame().to_excel(writer, sheet_name='Dashboard', index=False)
+    print(f"Exported {len(sales)} daily sales rows to {excel_file}")
+    return excel_file
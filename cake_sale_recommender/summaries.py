@@ -0,0 +1,207 @@
+"""
+Persisted weekly, monthly, day-of-week and regional sales summaries
+
+The summary tables are brought up to date incrementally: summary_state
+records the last sales.id folded in, and each update only reads sales
+with a higher id. Weeks and months touched by those sales are recomputed
+from daily_sales_rollup; day-of-week and region totals are additive and
+get the new quantities added. update_summary_tables(full=True) rebuilds
+everything, e.g. after sales were edited or deleted.
+"""
+from datetime import date, timedelta
+
+import pandas as pd
+
+import database
+
+DAYS_OF_WEEK = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+
+# SQLite's %w counts from Sunday; shift it so Monday is 0 like date.weekday()
+WEEKDAY_SQL = "(CAST(strftime('%w', {column}) AS INTEGER) + 6) % 7"
+
+
+def iso_week_start(years, weeks):
+    """
+    Monday of each ISO (year, week), computed column-wise
+
+    January 4th always falls in ISO week 1, so week 1 starts on the Monday
+    on or before it and every later week is a whole number of weeks on.
+    """
+    years = pd.Series(years).astype('int64')
+    weeks = pd.Series(weeks, index=years.index).astype('int64')
+    jan4 = pd.to_datetime(pd.DataFrame({'year': years, 'month': 1, 'day': 4}))
+    return jan4 - pd.to_timedelta(jan4.dt.dayofweek, unit='D') + pd.to_timedelta((weeks - 1) * 7, unit='D')
+
+
+def _month_range(year, month):
+    start = date(year, month, 1)
+    end = date(year + month // 12, month % 12 + 1, 1) - timedelta(days=1)
+    return start, end
+
+
+def _recompute_periods(cursor, days):
+    """Recompute the weekly and monthly rows covering the given days"""
+    weeks = {day.isocalendar()[:2] for day in days}
+    months = {(day.year, day.month) for day in days}
+
+    for iso_year, iso_week in weeks:
+        start = date.fromisocalendar(iso_year, iso_week, 1)
+        cursor.execute("DELETE FROM summary_weekly WHERE iso_year = ? AND iso_week = ?", (iso_year, iso_week))
+        cursor.execute(
+            '''
+            INSERT INTO summary_weekly (iso_year, iso_week, cake_id, qty)
+            SELECT ?, ?, cake_id, SUM(qty) FROM daily_sales_rollup
+            WHERE day BETWEEN ? AND ?
+            GROUP BY cake_id
+            ''',
+            (iso_year, iso_week, start.isoformat(), (start + timedelta(days=6)).isoformat())
+        )
+
+    for year, month in months:
+        start, end = _month_range(year, month)
+        cursor.execute("DELETE FROM summary_monthly WHERE year = ? AND month = ?", (year, month))
+        cursor.execute(
+            '''
+            INSERT INTO summary_monthly (year, month, cake_id, qty)
+            SELECT ?, ?, cake_id, SUM(qty) FROM daily_sales_rollup
+            WHERE day BETWEEN ? AND ?
+            GROUP BY cake_id
+            ''',
+            (year, month, start.isoformat(), end.isoformat())
+        )
+    return len(weeks), len(months)
+
+
+def _rebuild(cursor):
+    for table in ('summary_weekly', 'summary_monthly', 'summary_day_of_week', 'summary_region'):
+        cursor.execute(f"DELETE FROM {table}")
+    days = [date.fromisoformat(row[0]) for row in cursor.execute("SELECT DISTINCT day FROM daily_sales_rollup")]
+    periods = _recompute_periods(cursor, days)
+    cursor.execute(f'''
+        INSERT INTO summary_day_of_week (weekday, cake_id, qty)
+        SELECT {WEEKDAY_SQL.format(column='day')}, cake_id, SUM(qty)
+        FROM daily_sales_rollup
+        GROUP BY 1, cake_id
+    ''')
+    cursor.execute('''
+        INSERT INTO summary_region (region_id, cake_id, qty)
+        SELECT region_id, cake_id, SUM(qty) FROM daily_sales_rollup
+        GROUP BY region_id, cake_id
+    ''')
+    return periods
+
+
+def _fold_in(cursor, after_id, up_to_id):
+    """Add sales with after_id < id <= up_to_id to the summaries"""
+    days = [
+        date.fromisoformat(row[0]) for row in cursor.execute(
+            "SELECT DISTINCT date(sale_date) FROM sales WHERE id > ? AND id <= ?", (after_id, up_to_id)
+        )
+    ]
+    periods = _recompute_periods(cursor, days)
+    cursor.execute(f'''
+        INSERT INTO summary_day_of_week (weekday, cake_id, qty)
+        SELECT {WEEKDAY_SQL.format(column='sale_date')}, cake_id, SUM(quantity)
+        FROM sales
+        WHERE id > ? AND id <= ?
+        GROUP BY 1, cake_id
+        ON CONFLICT (weekday, cake_id) DO UPDATE SET qty = qty + excluded.qty
+    ''', (after_id, up_to_id))
+    cursor.execute('''
+        INSERT INTO summary_region (region_id, cake_id, qty)
+        SELECT region_id, cake_id, SUM(quantity)
+        FROM sales
+        WHERE id > ? AND id <= ?
+        GROUP BY region_id, cake_id
+        ON CONFLICT (region_id, cake_id) DO UPDATE SET qty = qty + excluded.qty
+    ''', (after_id, up_to_id))
+    return periods
+
+
+def update_summary_tables(full=False):
+    """
+    Bring the summary tables up to date
+
+    Parameters:
+    - full: Rebuild every summary from scratch instead of folding in new sales
+
+    Returns:
+    - Number of new sales rows folded in (all rows for a full rebuild)
+    """
+    with database.connection() as conn:
+        # IMMEDIATE takes the write lock up front so two workers cannot fold
+        # in the same rows
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            cursor = conn.cursor()
+            row = cursor.execute("SELECT value FROM summary_state WHERE name = 'last_sale_id'").fetchone()
+            last_id = 0 if row is None or full else row[0]
+            max_id = cursor.execute("SELECT COALESCE(MAX(id), 0) FROM sales").fetchone()[0]
+            if full:
+                weeks, months = _rebuild(cursor)
+            elif max_id > last_id:
+                weeks, months = _fold_in(cursor, last_id, max_id)
+            else:
+                conn.rollback()
+                return 0
+            cursor.execute(
+                '''
+                INSERT INTO summary_state (name, value) VALUES ('last_sale_id', ?)
+                ON CONFLICT (name) DO UPDATE SET value = excluded.value
+                ''',
+                (max_id,)
+            )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    print(f"{'Rebuilt' if full else 'Updated'} summaries: {max_id - last_id} sales, "
+          f"{weeks} weeks, {months} months recomputed")
+    return max_id - last_id
+
+
+def _read_wide(sql, index_columns, cake_types):
+    """Read (index..., Cake, Quantity) rows and pivot them to one column per cake type"""
+    with database.connection() as conn:
+        long_df = pd.read_sql(sql, conn, dtype={'Quantity': 'int64'})
+    cakes = list(dict.fromkeys(list(long_df['Cake'].unique()) + list(cake_types)))
+    if long_df.empty:
+        wide = pd.DataFrame(0, index=pd.RangeIndex(0), columns=index_columns + cakes)
+    else:
+        wide = long_df.pivot_table(
+            index=index_columns, columns='Cake', values='Quantity', aggfunc='sum', fill_value=0
+        ).reindex(columns=cakes, fill_value=0).reset_index()
+        wide.columns.name = None
+    wide[cakes] = wide[cakes].astype('int64')
+    wide['Total Sales'] = wide[cakes].sum(axis=1).astype('int64')
+    return wide
+
+
+def load_summaries(cake_types=()):
+    """
+    Read the summary tables as DataFrames with one column per cake type
+
+    Returns:
+    - Dictionary with 'weekly' (Year, Week), 'monthly' (Year, Month),
+      'day_of_week' (Day of Week) and 'region' (Region) frames
+    """
+    weekly = _read_wide('''
+        SELECT s.iso_year AS "Year", s.iso_week AS "Week", ct.name AS "Cake", s.qty AS "Quantity"
+        FROM summary_weekly s JOIN cake_types ct ON s.cake_id = ct.id
+    ''', ['Year', 'Week'], cake_types)
+    monthly = _read_wide('''
+        SELECT s.year AS "Year", s.month AS "Month", ct.name AS "Cake", s.qty AS "Quantity"
+        FROM summary_monthly s JOIN cake_types ct ON s.cake_id = ct.id
+    ''', ['Year', 'Month'], cake_types)
+    day_of_week = _read_wide('''
+        SELECT s.weekday AS "Weekday", ct.name AS "Cake", s.qty AS "Quantity"
+        FROM summary_day_of_week s JOIN cake_types ct ON s.cake_id = ct.id
+    ''', ['Weekday'], cake_types)
+    day_of_week.insert(0, 'Day of Week', [DAYS_OF_WEEK[day] for day in day_of_week.pop('Weekday')])
+    region = _read_wide('''
+        SELECT r.name AS "Region", ct.name AS "Cake", s.qty AS "Quantity"
+        FROM summary_region s
+        JOIN regions r ON s.region_id = r.id
+        JOIN cake_types ct ON s.cake_id = ct.id
+    ''', ['Region'], cake_types)
+    return {'weekly': weekly, 'monthly': monthly, 'day_of_week': day_of_week, 'region': region}
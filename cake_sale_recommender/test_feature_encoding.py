@@ -0,0 +1,44 @@
+"""
+Regions outside a model's vocabulary must not be predicted
+
+Run with `python -m pytest test_feature_encoding.py` from this directory.
+"""
+import os
+from datetime import datetime
+
+import numpy as np
+import pytest
+
+import database
+from cake_sales_analysis import CakeSalesTracker
+from conftest import REGIONS
+from feature_encoding import ENCODINGS, FeatureEncoder
+from storage import SQLiteSalesStorage
+
+
+@pytest.mark.parametrize('encoding', ENCODINGS)
+def test_encoder_rejects_unseen_region(sales_db, encoding):
+    encoder = FeatureEncoder(encoding)
+    assert encoder.regions == REGIONS
+    encoder.transform([datetime(2024, 3, 1)], ['North'])
+    with pytest.raises(ValueError, match='retrain required'):
+        encoder.transform([datetime(2024, 3, 1), datetime(2024, 3, 1)], ['North', 'Nowhere'])
+    row = np.zeros(len(encoder.feature_columns))
+    with pytest.raises(ValueError, match='retrain required'):
+        encoder.fill_row(row, datetime(2024, 3, 1), 'Nowhere')
+
+
+def test_tracker_does_not_predict_unseen_region(sales_db):
+    tracker = CakeSalesTracker(storage=SQLiteSalesStorage(), model_dir=os.path.join(sales_db, 'models'))
+    tracker.train_prediction_model(workers=1)
+    # Added after training, so it is in the regions table but not the model's vocabulary
+    database.add_region('East')
+
+    serving = CakeSalesTracker(storage=SQLiteSalesStorage(), model_dir=os.path.join(sales_db, 'models'))
+    assert serving.predict_next_day('2024-03-01', 'North') is not None
+    assert serving.predict_fast('2024-03-01', 'North') is not None
+    for region in ('East', 'Nowhere'):
+        assert serving.predict_next_day('2024-03-01', region) is None
+        assert serving.predict_fast('2024-03-01', region) is None
+        assert serving.predict_range('2024-03-01', '2024-03-02', ['North', region]) is None
+    assert set(serving.predict_range('2024-03-01', '2024-03-02')['Region']) == set(REGIONS)
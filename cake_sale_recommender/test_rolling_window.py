@@ -0,0 +1,29 @@
+"""
+Rolling windows moved forward must match windows rebuilt for the new day
+
+Run with `python -m pytest test_rolling_window.py` from this directory.
+"""
+from datetime import date
+
+import database
+from rolling_window import RollingWindowAggregator
+
+
+def test_advance_matches_rebuild(sales_db, monkeypatch):
+    aggregator = RollingWindowAggregator()
+    monkeypatch.setattr(database, '_sales_listeners', [lambda regions, totals: aggregator.add_sales(totals)])
+    aggregator.rebuild(today=date(2024, 2, 10))
+    # Sales inside every window, on a day that already has sales and ahead of today
+    database.add_sales_bulk([
+        (date(2024, 2, 9), 'North', 'Chocolate', 5),
+        (date(2024, 1, 20), 'South', 'Vanilla', 7),
+        (date(2024, 3, 5), 'North', 'Strawberry', 3),
+    ])
+    database.add_sale('2023-12-01', 'South', 'Red Velvet', 4)
+
+    for today in (date(2024, 2, 11), date(2024, 2, 25), date(2024, 4, 20)):
+        aggregator.advance(today=today)
+        fresh = RollingWindowAggregator()
+        fresh.rebuild(today=today)
+        assert aggregator._days == fresh._days
+        assert aggregator._totals == fresh._totals
@@ -0,0 +1,39 @@
+"""
+Reading through a snapshot must give the same sales as reading SQLite
+
+Run with `python -m pytest test_snapshot_store.py` from this directory.
+"""
+import os
+from datetime import date
+
+import pandas as pd
+import pytest
+
+import database
+import snapshot_store
+from cake_sales_analysis import CAKE_TYPES
+from snapshot_store import SnapshotSalesStorage
+from storage import SQLiteSalesStorage
+
+pytestmark = pytest.mark.skipif(not snapshot_store.available(), reason='pyarrow is not installed')
+
+
+def _sorted(sales):
+    return sales.sort_values(['Date', 'Region'], ignore_index=True)
+
+
+def test_snapshot_matches_sqlite_after_new_sales(sales_db):
+    snapshot_dir = os.path.join(sales_db, 'snapshots')
+    snapshot_store.write_snapshot(snapshot_dir=snapshot_dir)
+    assert snapshot_store.latest_snapshot(snapshot_dir) is not None
+    # A day already in the snapshot, a new day and a new month
+    database.add_sales_bulk([
+        (date(2024, 2, 10), 'North', 'Chocolate', 5),
+        (date(2024, 2, 10), 'South', 'Red Velvet', 1),
+        (date(2024, 3, 1), 'South', 'Vanilla', 7),
+        (date(2024, 4, 2), 'North', 'Strawberry', 3),
+    ])
+
+    from_snapshot = SnapshotSalesStorage(snapshot_dir).load_sales(CAKE_TYPES)
+    from_sqlite = SQLiteSalesStorage().load_sales(CAKE_TYPES)
+    pd.testing.assert_frame_equal(_sorted(from_snapshot), _sorted(from_sqlite))
@@ -0,0 +1,33 @@
+"""
+Summaries folded in sale by sale must match a full rebuild
+
+Run with `python -m pytest test_summaries.py` from this directory.
+"""
+from datetime import date
+
+import database
+from conftest import REGIONS
+from summaries import update_summary_tables
+
+SUMMARY_TABLES = ('summary_weekly', 'summary_monthly', 'summary_day_of_week', 'summary_region')
+
+
+def _summary_rows():
+    with database.connection() as conn:
+        return {table: sorted(conn.execute(f"SELECT * FROM {table}").fetchall()) for table in SUMMARY_TABLES}
+
+
+def test_fold_in_matches_full_rebuild(sales_db):
+    update_summary_tables()
+    # A day already summarised, a new day in the same week and a new month
+    database.add_sales_bulk([
+        (date(2024, 2, 29), 'North', 'Chocolate', 5),
+        (date(2024, 3, 1), 'South', 'Vanilla', 7),
+        (date(2024, 3, 11), 'North', 'Chocolate', 3),
+    ])
+    database.add_sale('2024-01-15', REGIONS[1], 'Chocolate', 2)
+    assert update_summary_tables() == 4
+    folded = _summary_rows()
+
+    update_summary_tables(full=True)
+    assert folded == _summary_rows()
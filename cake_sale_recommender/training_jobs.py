@@ -0,0 +1,233 @@
+"""
+Background model training jobs
+
+Training runs on a single background thread, on its own CakeSalesTracker,
+so HTTP requests return immediately and the tracker serving predictions
+keeps its current models. The new version is published to the model
+registry only once training has finished; serving trackers pick it up on
+their next prediction. A training request matching one that is already
+queued or running returns the existing job instead of starting another.
+
+Jobs live in memory. So that worker processes sharing a model directory
+do not train the same model side by side, a queued or running job also
+holds an flock on a guard file in the model directory, holding the job's
+status; a request matching a job another process holds returns that job.
+The lock is released when the job finishes or its process dies.
+"""
+import json
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+import model_registry
+from cake_sales_analysis import CAKE_TYPES, MODEL_MODES, MULTI_OUTPUT_MODEL, CakeSalesTracker
+
+QUEUED = 'queued'
+RUNNING = 'running'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+
+# Finished jobs kept for status queries
+MAX_FINISHED_JOBS = 50
+
+
+def _now():
+    return datetime.now().isoformat(timespec='seconds')
+
+
+def _guard_name(mode, incremental):
+    return f".training-{mode}{'-incremental' if incremental else ''}.lock"
+
+
+class TrainingJobQueue:
+    def __init__(self, tracker_factory=CakeSalesTracker, model_dir=model_registry.MODEL_DIR):
+        """
+        Parameters:
+        - tracker_factory: Returns the tracker each job trains on; it must
+          share the model registry directory with the serving tracker
+        - model_dir: That model registry directory, where the guard files
+          other processes check are kept
+        """
+        self.tracker_factory = tracker_factory
+        self.model_dir = model_dir
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='training')
+        self._lock = threading.Lock()
+        self._jobs = {}
+        # Guard file descriptor of each queued or running job
+        self._guards = {}
+
+    def submit(self, mode='per_cake', incremental=False):
+        """
+        Queue a training run, or return the queued/running job with the same options
+
+        Parameters:
+        - mode: Model mode, see CakeSalesTracker.train_prediction_model
+        - incremental: Extend the latest model with trees for new sales only
+
+        Returns:
+        - (job, created) where job is the status dictionary from status()
+        """
+        if mode not in MODEL_MODES:
+            raise ValueError(f"Unknown model mode '{mode}'; choose from {MODEL_MODES}.")
+        with self._lock:
+            for job in self._jobs.values():
+                if job['mode'] == mode and job['incremental'] == incremental and job['status'] in (QUEUED, RUNNING):
+                    return self._snapshot(job), False
+            guard = self._acquire_guard(mode, incremental)
+            if guard is None:
+                return self._held_job(mode, incremental), False
+            models = [MULTI_OUTPUT_MODEL] if mode == 'multi_output' else CAKE_TYPES
+            job = {
+                'id': uuid.uuid4().hex,
+                'mode': mode,
+                'incremental': incremental,
+                'status': QUEUED,
+                'created_at': _now(),
+                'started_at': None,
+                'finished_at': None,
+                'progress': {name: 'pending' for name in models},
+                'metrics': {},
+                'model_version': None,
+                'error': None,
+            }
+            self._jobs[job['id']] = job
+            self._guards[job['id']] = guard
+            self._write_guard(job)
+            self._prune()
+            snapshot = self._snapshot(job)
+        self._executor.submit(self._run, job)
+        return snapshot, True
+
+    def _prune(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job['status'] in (SUCCEEDED, FAILED)]
+        for job_id in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del self._jobs[job_id]
+
+    def _guard_path(self, mode, incremental):
+        return os.path.join(self.model_dir, _guard_name(mode, incremental))
+
+    def _acquire_guard(self, mode, incremental):
+        """Locked guard file descriptor, or None if another process holds the guard"""
+        if fcntl is None:
+            return -1
+        os.makedirs(self.model_dir, exist_ok=True)
+        fd = os.open(self._guard_path(mode, incremental), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return None
+        return fd
+
+    def _write_guard(self, job):
+        fd = self._guards.get(job['id'], -1)
+        if fd < 0:
+            return
+        os.ftruncate(fd, 0)
+        os.pwrite(fd, json.dumps(self._snapshot(job)).encode(), 0)
+
+    def _release_guard(self, job):
+        fd = self._guards.pop(job['id'], -1)
+        if fd >= 0:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+
+    def _held_job(self, mode, incremental):
+        """Status of the job another process holds the guard for"""
+        path = self._guard_path(mode, incremental)
+        # The holder writes the status right after taking the lock
+        for _ in range(50):
+            try:
+                with open(path) as f:
+                    return json.load(f)
+            except ValueError:
+                time.sleep(0.01)
+        raise RuntimeError(f"Training ({mode}) is already running in another process.")
+
+    def _other_process_job(self, job_id):
+        """Status of a queued or running job of another process, or None"""
+        if fcntl is None or not os.path.isdir(self.model_dir):
+            return None
+        for name in os.listdir(self.model_dir):
+            if not (name.startswith('.training-') and name.endswith('.lock')):
+                continue
+            with open(os.path.join(self.model_dir, name)) as f:
+                try:
+                    fcntl.flock(f, fcntl.LOCK_SH | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    try:
+                        job = json.load(f)
+                    except ValueError:
+                        continue
+                    if job.get('id') == job_id:
+                        return job
+        return None
+
+    def _run(self, job):
+        with self._lock:
+            job['status'] = RUNNING
+            job['started_at'] = _now()
+            for name in job['progress']:
+                job['progress'][name] = 'training'
+            self._write_guard(job)
+
+        def progress(name, metrics):
+            with self._lock:
+                job['progress'][name] = 'done'
+                job['metrics'].update(metrics)
+
+        try:
+            tracker = self.tracker_factory()
+            tracker.train_prediction_model(mode=job['mode'], progress=progress, incremental=job['incremental'])
+            # Not tracker.models, which would unpickle a kept version's forests
+            if tracker.model_version is None:
+                raise RuntimeError("No sales data to train on.")
+        except Exception as e:
+            with self._lock:
+                job['status'] = FAILED
+                job['error'] = str(e)
+                job['finished_at'] = _now()
+                self._release_guard(job)
+            print(f"Training job {job['id']} failed: {e}")
+            return
+        with self._lock:
+            job['status'] = SUCCEEDED
+            # An incremental run with too few new sales keeps the current version
+            for name, state in job['progress'].items():
+                if state == 'training':
+                    job['progress'][name] = 'skipped'
+            job['model_version'] = tracker.model_version
+            job['metrics'] = tracker.training_report
+            job['finished_at'] = _now()
+            self._release_guard(job)
+        print(f"Training job {job['id']} finished: model version {tracker.model_version}")
+
+    @staticmethod
+    def _snapshot(job):
+        return {**job, 'progress': dict(job['progress']), 'metrics': dict(job['metrics'])}
+
+    def status(self, job_id):
+        """
+        Copy of the job's status dictionary, or None for an unknown id
+
+        A job queued or running in another process is found through its
+        guard file; its status there is only updated when it starts running.
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                return self._snapshot(job)
+        return self._other_process_job(job_id)
+
+    def jobs(self):
+        """Status of every known job, oldest first"""
+        with self._lock:
+            return [self._snapshot(job) for job in self._jobs.values()]